@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'uploader',
     'CS_game',
     'machine_learning',
+    'dates',
 ]
 
 MIDDLEWARE = [
@@ -137,3 +138,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# how many docx_replace jobs / file_renamer sessions (with their files in MEDIA_ROOT)
+# are kept; older ones are deleted when a new one is saved
+DOCX_REPLACE_KEEP_JOBS = 20
+FILE_RENAMER_KEEP_SESSIONS = 20
@@ -1,7 +1,8 @@
 # docx_utils.py
 import os
 import re
-import shutil
+
+from core.zip_utils import precompress
 
 def parse_filename(filename):
     """
@@ -20,24 +21,32 @@ def parse_filename(filename):
     else:
         return base, None, ext
 
-def clone_docx(source_path, target_start, target_end):
+def clone_names(source_path, target_start, target_end):
     """
-    Clones the source DOCX file into new files with target numbers from target_start to target_end.
+    New filenames for target numbers target_start..target_end (no file is touched).
     If the source filename ends with a number (e.g., TS1.docx), that numeric part is replaced
     with the new number; otherwise, the new number is appended.
-    Returns a list of the new filenames created.
     """
     prefix, source_number, ext = parse_filename(source_path)
     # Determine default number if none found.
     if source_number is None:
         source_number = 0
-    created_files = []
+    new_names = []
     for i in range(target_start, target_end + 1):
         if source_number:
             new_filename = f"{prefix}{i}{ext}"
         else:
             base = os.path.splitext(source_path)[0]
             new_filename = f"{base}{i}{ext}"
-        shutil.copy2(source_path, new_filename)
-        created_files.append(new_filename)
-    return created_files
+        new_names.append(new_filename)
+    return new_names
+
+def iter_clone_entries(source_bytes, source_name, target_start, target_end):
+    """
+    Same clones as (new filename, payload) entries for stream_zip(), produced lazily
+    (nothing on disk). The source is compressed and its CRC computed once; each entry
+    is a new header + that payload.
+    """
+    payload = precompress(source_bytes)
+    for new_filename in clone_names(os.path.basename(source_name), target_start, target_end):
+        yield new_filename, payload
@@ -1,44 +1,27 @@
 from django.shortcuts import render
 
 # clone_files/views.py
-import os
-import zipfile
-import tempfile
-from django.conf import settings
-from django.http import HttpResponse, HttpResponseRedirect, FileResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from .forms import CloneDocxForm
-from .docx_utils import clone_docx  # our utility function
+from core.zip_utils import stream_zip
+from .docx_utils import iter_clone_entries  # our utility function
 
 def clone_view(request):
     if request.method == "POST":
         form = CloneDocxForm(request.POST, request.FILES)
         if form.is_valid():
-            # Save uploaded file to a temporary location
+            # Uploaded source file + target range from the validated form
             source_file = form.cleaned_data['source_file']
             target_start = form.cleaned_data['target_start']
             target_end = form.cleaned_data['target_end']
             
-            # Create a temporary directory for processing
-            temp_dir = tempfile.mkdtemp()
-            source_path = os.path.join(temp_dir, source_file.name)
+            # Stream the ZIP entry by entry; the source is compressed once for all clones
+            entries = iter_clone_entries(source_file.read(), source_file.name, target_start, target_end)
             
-            with open(source_path, 'wb') as f:
-                for chunk in source_file.chunks():
-                    f.write(chunk)
-            
-            # Clone the DOCX file. This returns a list of file paths.
-            new_files = clone_docx(source_path, target_start, target_end)
-            
-            # Create a zip file containing the cloned files
-            zip_filename = os.path.join(temp_dir, "cloned_files.zip")
-            with zipfile.ZipFile(zip_filename, 'w') as zf:
-                for file_path in new_files:
-                    # Write each cloned file with its basename into the zip
-                    zf.write(file_path, arcname=os.path.basename(file_path))
-            
-            # Return the zip file as a file response for download
-            response = FileResponse(open(zip_filename, 'rb'), as_attachment=True, filename='cloned_files.zip')
+            # Return the zip file as a streaming response for download
+            response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+            response['Content-Disposition'] = 'attachment; filename="cloned_files.zip"'
             return response
     else:
         form = CloneDocxForm()
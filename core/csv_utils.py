@@ -0,0 +1,29 @@
+# core/csv_utils.py
+# CSV helpers shared by the apps that accept a CSV wherever they take an Excel
+# file (dates, file_renamer).
+
+import csv
+import os
+
+SNIFF_BYTES = 65536
+
+
+def sniff_delimiter(source) -> str:
+    """
+    Field delimiter of a CSV (path or file object), sniffed from its first
+    64 KB: Excel exports use ";" in locales with a decimal comma, some tools
+    tabs or "|". Falls back to ",". A file object is rewound afterwards.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    else:
+        source.seek(0)
+        head = source.read(SNIFF_BYTES)
+        source.seek(0)
+    if isinstance(head, bytes):
+        head = head.decode("utf-8", errors="replace")
+    try:
+        return csv.Sniffer().sniff(head, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
@@ -0,0 +1,162 @@
+# core/date_utils.py
+# Date parsing shared by the apps that read dates out of Excel/CSV registers
+# (dates, docx_replace).
+#
+# pd.to_datetime() without an explicit format parses a mixed column element by
+# element (format="mixed" / dateutil), which dominates the run time on large
+# registers. Here a sample of the text values picks the format(s) actually in
+# use, the bulk of the column is parsed with those explicit (vectorized)
+# formats, Excel serial numbers are converted arithmetically, and only what is
+# left over goes through the slow generic parser.
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+SAMPLE_SIZE = 200  # distinct text values tried against the candidate formats
+
+# Excel's day 0 for every serial from 61 (1900-03-01) on. Excel counts a
+# 29 Feb 1900 that never existed, so serials 1-60 come out one day early here
+# (serial 1 = 1899-12-31); registers do not contain such dates.
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+EXCEL_MAX_SERIAL = 2958465  # 9999-12-31
+
+# Tried in this order; on a tie the earlier one wins. The day-first and the
+# month-first formats are never mixed in one column: see infer_formats().
+DAYFIRST_FORMATS = [
+    "%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%y", "%d/%m/%y",
+    "%d.%m.%Y %H:%M", "%d.%m.%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S",
+]
+MONTHFIRST_FORMATS = [
+    "%m/%d/%Y", "%m-%d-%Y", "%m/%d/%y", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S",
+]
+NEUTRAL_FORMATS = ["ISO8601", "%Y/%m/%d", "%Y.%m.%d", "%Y%m%d", "%d %B %Y", "%d %b %Y", "%B %d, %Y"]
+
+
+def candidate_formats(dayfirst: bool = True) -> list:
+    if dayfirst:
+        return NEUTRAL_FORMATS + DAYFIRST_FORMATS + MONTHFIRST_FORMATS
+    return NEUTRAL_FORMATS + MONTHFIRST_FORMATS + DAYFIRST_FORMATS
+
+
+def infer_formats(texts: pd.Series, dayfirst: bool = True, sample_size: int = SAMPLE_SIZE) -> list:
+    """
+    Formats that parse at least one value of a sample of `texts` (stripped
+    strings), the most frequent first.
+    The preferred order (day first when `dayfirst`) is kept whenever one of
+    its formats parses the sample: the formats of the other order are then
+    dropped, even where they would parse more values, so a few "01/13/2024"
+    cannot turn a day-first column month-first. Those values are left to the
+    generic parser.
+    """
+    preferred, other = ((DAYFIRST_FORMATS, MONTHFIRST_FORMATS) if dayfirst
+                        else (MONTHFIRST_FORMATS, DAYFIRST_FORMATS))
+    sample = pd.Series(texts.unique()[:sample_size])
+    hits = {}
+    for position, fmt in enumerate(candidate_formats(dayfirst)):
+        parsed = pd.to_datetime(sample, format=fmt, errors="coerce")
+        count = int(parsed.notna().sum())
+        if count:
+            hits[fmt] = (-count, position)
+    if any(fmt in hits for fmt in preferred):
+        hits = {fmt: rank for fmt, rank in hits.items() if fmt not in other}
+    return sorted(hits, key=hits.get)
+
+
+def excel_serial_to_datetime(serials: pd.Series) -> pd.Series:
+    """
+    Excel serial day numbers (fractions = time of day) -> datetimes; values
+    outside Excel's date range become NaT.
+    """
+    serials = pd.to_numeric(serials, errors="coerce").astype("float64")
+    serials = serials.where((serials >= 1) & (serials <= EXCEL_MAX_SERIAL))
+    # whole milliseconds (drops float noise like 10:29:59.9999), in microsecond
+    # resolution - nanoseconds would overflow before year 9999
+    millis = (serials * 86_400_000).round().fillna(0).astype("int64").to_numpy()
+    out = pd.Series(np.datetime64(EXCEL_EPOCH, "us") + millis.astype("timedelta64[ms]"), index=serials.index)
+    return out.where(serials.notna())
+
+
+def parse_dates(values, dayfirst: bool = True, sample_size: int = SAMPLE_SIZE) -> pd.Series:
+    """
+    Parse a column of dates the way pd.to_datetime(values, dayfirst=True,
+    errors="coerce") would, but fast on large mixed columns:
+    1) every distinct value is parsed once (registers repeat the same dates)
+    2) datetime cells (what openpyxl gives for real Excel dates) are taken as they are;
+       timezone-aware ones keep their local date and time, without the zone
+    3) numbers, and texts that are plain numbers, are Excel serials, converted
+       arithmetically; whole numbers outside the serial range are tried as
+       compact dates (20240105) with the texts
+    4) the other texts: formats inferred from a sample (infer_formats) are
+       applied one after another, each to all remaining texts at once
+    5) only texts none of them parse go through the generic parser
+    Returns a datetime64 Series on the same index; unparseable values are NaT.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # tz-aware columns come back naive, in their own local time (see _naive)
+        return series.dt.tz_localize(None) if series.dt.tz is not None else series
+    if pd.api.types.is_bool_dtype(series):
+        return pd.Series(pd.NaT, index=series.index, dtype="datetime64[us]")
+
+    # ---- 1) distinct values; empty cells get code -1 ----
+    codes, uniques = pd.factorize(series)
+    parsed = _parse_distinct(pd.Series(uniques, dtype=object), dayfirst, sample_size).to_numpy()
+    # one NaT appended at the end, so code -1 picks it
+    parsed = np.append(parsed, np.datetime64("NaT", "us"))
+    return pd.Series(parsed.take(codes), index=series.index)
+
+
+def _naive(value):
+    # aware datetime/Timestamp -> its wall-clock time without the zone, so it can
+    # share a column with naive values (a register date is the local date)
+    return value.replace(tzinfo=None) if isinstance(value, datetime) and value.tzinfo is not None else value
+
+
+def _number_text(value) -> str:
+    number = float(value)
+    return str(int(number)) if number.is_integer() else str(value)
+
+
+def _parse_distinct(values: pd.Series, dayfirst: bool, sample_size: int) -> pd.Series:
+    # steps 2-5 of parse_dates() on distinct, non-empty values
+    result = pd.Series(pd.NaT, index=values.index, dtype="datetime64[us]")
+    if values.empty:
+        return result
+
+    # ---- 2) real datetimes ----
+    is_datetime = values.map(lambda v: isinstance(v, (datetime, date))).astype(bool)
+    if is_datetime.any():
+        result[is_datetime[is_datetime].index] = pd.to_datetime(values[is_datetime].map(_naive), errors="coerce")
+    rest = values[~is_datetime]
+
+    # ---- 3) Excel serials: numbers, or text that is only a number ----
+    is_number = rest.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).astype(bool)
+    texts = rest[~is_number].astype(str).str.strip()
+    numeric_text = texts.str.fullmatch(r"\d+(\.\d+)?")
+    numbers = pd.concat([rest[is_number], texts[numeric_text]])
+    if not numbers.empty:
+        serial_dates = excel_serial_to_datetime(numbers)
+        parsed = serial_dates.notna()
+        result[serial_dates[parsed].index] = serial_dates[parsed]
+        # numbers out of the serial range may still be compact dates (20240105);
+        # 20240105.0 (a float cell) is written without the ".0"
+        texts = pd.concat([texts[~numeric_text], numbers[~parsed].map(_number_text)])
+    texts = texts[texts != ""]
+
+    # ---- 4) the inferred formats, most frequent first, each vectorized ----
+    if not texts.empty:
+        for fmt in infer_formats(texts, dayfirst, sample_size):
+            parsed = pd.to_datetime(texts, format=fmt, errors="coerce")
+            ok = parsed.notna()
+            result[parsed[ok].index] = parsed[ok]
+            texts = texts[~ok]
+            if texts.empty:
+                break
+
+    # ---- 5) leftovers: generic per-element parsing ----
+    if not texts.empty:
+        parsed = pd.to_datetime(texts, format="mixed", dayfirst=dayfirst, errors="coerce")
+        result[parsed.index] = parsed
+    return result
@@ -1,3 +1,102 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
 # Create your tests here.
+import io
+import os
+import tempfile
+import zipfile
+
+from core import zip_utils
+from core.zip_utils import (Precompressed, RawMember, copy_member, open_zip, precompress, read_raw_member,
+                            stream_zip, write_raw_member)
+
+# Round trips of the raw ZIP helpers. They depend on zipfile internals (see
+# zip_utils.SUPPORTED_PYTHON), so these tests are what catches a stdlib change.
+
+MEMBERS = {
+    "a.txt": (b"first member " * 500, zipfile.ZIP_DEFLATED),
+    "dir/b.bin": (os.urandom(3000), zipfile.ZIP_STORED),
+    "empty.txt": (b"", zipfile.ZIP_DEFLATED),
+}
+
+
+def make_source():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, (data, compression) in MEMBERS.items():
+            zf.writestr(name, data, compress_type=compression)
+    return buffer.getvalue()
+
+
+class ZipUtilsRoundTripTests(SimpleTestCase):
+
+    def assertValidArchive(self, data, expected):
+        # expected: {arcname: (content, CRC)}; testzip() checks every CRC against the data
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(sorted(zf.namelist()), sorted(expected))
+            for name, (content, crc) in expected.items():
+                info = zf.getinfo(name)
+                self.assertEqual(info.CRC, crc)
+                self.assertEqual(zf.read(name), content)
+
+    def source_expectation(self, rename=None):
+        rename = rename or {}
+        with zipfile.ZipFile(io.BytesIO(make_source())) as zf:
+            return {rename.get(info.filename, info.filename): (zf.read(info), info.CRC) for info in zf.infolist()}
+
+    def test_raw_copy_and_rename(self):
+        out = io.BytesIO()
+        with open_zip(make_source()) as zin, zipfile.ZipFile(out, "w") as zout:
+            for info in zin.infolist():
+                copy_member(zin, info, zout, "renamed.txt" if info.filename == "a.txt" else None)
+            # the payload is the source's compressed bytes, not a recompression
+            self.assertEqual(len(read_raw_member(zin, zin.getinfo("a.txt"))), zin.getinfo("a.txt").compress_size)
+        self.assertValidArchive(out.getvalue(), self.source_expectation({"a.txt": "renamed.txt"}))
+
+    def test_precompressed_written_under_several_names(self):
+        data = b"cloned payload " * 1000
+        payload = precompress(data)
+        self.assertIsInstance(payload, Precompressed)
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, "w") as zout:
+            for i in range(3):
+                write_raw_member(zout, payload.info, payload.raw, f"clone{i}.txt")
+        crc = zipfile.ZipFile(io.BytesIO(out.getvalue())).getinfo("clone0.txt").CRC
+        self.assertValidArchive(out.getvalue(), {f"clone{i}.txt": (data, crc) for i in range(3)})
+        self.assertEqual(crc, payload.info.CRC)
+
+    def test_stream_zip_mixes_entry_kinds(self):
+        payload = precompress(b"precompressed")
+        with open_zip(make_source()) as zin:
+            entries = [("raw/" + info.filename, RawMember(zin, info)) for info in zin.infolist()]
+            entries += [("pre.txt", payload), ("plain.txt", b"plain bytes")]
+            data = b"".join(stream_zip(entries))
+        expected = {"raw/" + name: value for name, value in self.source_expectation().items()}
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            expected["pre.txt"] = (b"precompressed", payload.info.CRC)
+            expected["plain.txt"] = (b"plain bytes", zf.getinfo("plain.txt").CRC)
+        self.assertValidArchive(data, expected)
+
+    def test_open_zip_memory_maps_paths_and_closes(self):
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as f:
+            f.write(make_source())
+        try:
+            zf = open_zip(f.name)
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read("a.txt"), MEMBERS["a.txt"][0])
+            mapped = zf.fp._map
+            zf.close()  # _filePassed is cleared, so this releases the mapping too
+            self.assertTrue(mapped.closed)
+        finally:
+            os.remove(f.name)
+
+    def test_encrypted_member_is_refused(self):
+        with open_zip(make_source()) as zin:
+            info = zin.getinfo("a.txt")
+            info.flag_bits |= 0x01
+            with self.assertRaises(ValueError):
+                read_raw_member(zin, info)
+
+    def test_zipfile_internals_present(self):
+        zip_utils._check_zipfile_internals()  # raises ImportError when the stdlib changed
@@ -0,0 +1,293 @@
+# core/zip_utils.py
+# Small helpers shared by the ZIP-producing apps (docx_replace, docxcloner,
+# clone_files, file_renamer).
+#
+# The standard zipfile module can only hand out *decompressed* member data and
+# always recompresses on write. When a member is passed through unchanged
+# (copied, renamed, cloned) that is wasted CPU, so these helpers move the
+# already-compressed bytes + CRC straight from one archive to another and only
+# write new headers.
+
+import io
+import mmap
+import os
+import struct
+import sys
+import time
+import warnings
+import zipfile
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+
+# Python versions these helpers are tested on. The raw copy and open_zip()
+# rely on zipfile internals: the ZipFile attributes in _ZIPFILE_ATTRS and the
+# module's local-header constants in _ZIPFILE_NAMES. Their presence is checked
+# on import (ImportError otherwise) and core/tests.py round-trips every helper,
+# so a stdlib change fails loudly instead of producing broken archives.
+SUPPORTED_PYTHON = ((3, 10), (3, 13))
+_ZIPFILE_NAMES = ("sizeFileHeader", "structFileHeader", "stringFileHeader",
+                  "_FH_FILENAME_LENGTH", "_FH_EXTRA_FIELD_LENGTH")
+_ZIPFILE_ATTRS = ("_lock", "_writing", "_seekable", "_writecheck", "_didModify", "start_dir", "_filePassed")
+
+
+def _check_zipfile_internals():
+    missing = [name for name in _ZIPFILE_NAMES if not hasattr(zipfile, name)]
+    with zipfile.ZipFile(io.BytesIO(), "w") as probe:
+        missing += [f"ZipFile.{name}" for name in _ZIPFILE_ATTRS if not hasattr(probe, name)]
+    if missing:
+        raise ImportError(f"core.zip_utils: zipfile of Python {sys.version.split()[0]} lacks {', '.join(missing)}; "
+                          f"supported: {SUPPORTED_PYTHON[0]} to {SUPPORTED_PYTHON[1]}")
+    if not SUPPORTED_PYTHON[0] <= sys.version_info[:2] <= SUPPORTED_PYTHON[1]:
+        warnings.warn(f"core.zip_utils is not tested on Python {sys.version_info[0]}.{sys.version_info[1]}; "
+                      f"run core.tests before relying on raw ZIP copies", RuntimeWarning)
+
+
+_check_zipfile_internals()
+
+# general purpose bit flags we care about
+_FLAG_ENCRYPTED = 0x01
+_FLAG_DATA_DESCRIPTOR = 0x08
+
+
+def iter_raw_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, chunk_size: int = CHUNK_SIZE):
+    """
+    Yield the compressed payload of `info` from the open archive `zf`,
+    chunk by chunk, without decompressing it.
+    """
+    if info.flag_bits & _FLAG_ENCRYPTED:
+        raise ValueError(f"Encrypted member cannot be copied: {info.filename}")
+
+    # The local header has its own (variable) name/extra lengths, so read it
+    # to find where the data starts.
+    with zf._lock:
+        zf.fp.seek(info.header_offset)
+        header = zf.fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    fheader = struct.unpack(zipfile.structFileHeader, header)
+    pos = (info.header_offset + zipfile.sizeFileHeader
+           + fheader[zipfile._FH_FILENAME_LENGTH] + fheader[zipfile._FH_EXTRA_FIELD_LENGTH])
+
+    remaining = info.compress_size
+    while remaining > 0:
+        # the file object is shared, so always seek before reading
+        with zf._lock:
+            zf.fp.seek(pos)
+            chunk = zf.fp.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated member: {info.filename}")
+        pos += len(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def read_raw_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """
+    Whole compressed payload of `info` as bytes.
+    """
+    return b"".join(iter_raw_member(zf, info))
+
+
+def write_raw_member(zout: zipfile.ZipFile, src_info: zipfile.ZipInfo, raw, arcname: str = None):
+    """
+    Write an already-compressed payload into `zout`.
+
+    `src_info` supplies the compression method, CRC and sizes (it usually comes
+    from another archive); `raw` is bytes or an iterable of byte chunks;
+    `arcname` renames the entry. Works for seekable and streaming outputs.
+    """
+    zinfo = zipfile.ZipInfo(arcname or src_info.filename, src_info.date_time)
+    zinfo.compress_type = src_info.compress_type
+    zinfo.CRC = src_info.CRC
+    zinfo.compress_size = src_info.compress_size
+    zinfo.file_size = src_info.file_size
+    zinfo.external_attr = src_info.external_attr
+    zinfo.create_system = src_info.create_system
+    # sizes are known up front, so no trailing data descriptor is needed
+    zinfo.flag_bits = src_info.flag_bits & ~_FLAG_DATA_DESCRIPTOR
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        raw = (raw,)
+
+    # Same bookkeeping ZipFile.write() does for directory entries.
+    with zout._lock:
+        if zout._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+        if zout._seekable:
+            zout.fp.seek(zout.start_dir)
+        zinfo.header_offset = zout.fp.tell()
+        zout._writecheck(zinfo)
+        zout._didModify = True
+        zout.fp.write(zinfo.FileHeader(zip64))
+        for chunk in raw:
+            zout.fp.write(chunk)
+        zout.filelist.append(zinfo)
+        zout.NameToInfo[zinfo.filename] = zinfo
+        zout.start_dir = zout.fp.tell()
+    return zinfo
+
+
+def copy_member(zin: zipfile.ZipFile, info: zipfile.ZipInfo, zout: zipfile.ZipFile, arcname: str = None):
+    """
+    Copy one member from `zin` to `zout` byte-for-byte (optionally renamed),
+    without decompressing or recompressing it.
+    """
+    return write_raw_member(zout, info, iter_raw_member(zin, info), arcname)
+
+
+class _MappedFile:
+    # Read-only file object over an mmap. mmap already reads/seeks like a file
+    # but (before Python 3.13) has no seekable(), which zipfile needs.
+    def __init__(self, mapped: mmap.mmap):
+        self._map = mapped
+
+    def read(self, n=-1):
+        return self._map.read(n)
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        self._map.seek(pos, whence)
+        return self._map.tell()
+
+    def tell(self):
+        return self._map.tell()
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._map.close()
+
+
+def _open_seekable(source):
+    # path / upload spooled to disk -> mmap; bytes -> BytesIO; file object -> itself
+    if hasattr(source, "temporary_file_path"):  # Django TemporaryUploadedFile
+        source = source.temporary_file_path()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            try:
+                # the mapping stays valid after the descriptor is closed
+                return _MappedFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            except (ValueError, OSError):  # empty file, or no mmap on this file system
+                pass
+        return open(source, "rb")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def open_zip(source) -> zipfile.ZipFile:
+    """
+    Open an archive for reading without copying it into memory first.
+
+    `source` is a path, a Django upload, any seekable file object or bytes.
+    Paths and uploads Django has spooled to disk (TemporaryUploadedFile) are
+    memory-mapped: only the central directory and the members actually read
+    are paged in, however large the archive. Small uploads that Django keeps
+    in memory are read where they are; bytes are still accepted.
+    Closing the archive also releases the mapping (a file object passed in
+    by the caller stays open).
+    """
+    fp = _open_seekable(source)
+    try:
+        zf = zipfile.ZipFile(fp)
+    except Exception:
+        if fp is not source:
+            fp.close()
+        raise
+    if fp is not source:
+        zf._filePassed = False  # let ZipFile.close() close what we opened
+    return zf
+
+
+class RawMember:
+    """
+    Reference to a member of an open archive that should be passed through
+    as-is (compressed bytes + CRC) when used as an entry for stream_zip().
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, info: zipfile.ZipInfo):
+        self.zf = zf
+        self.info = info
+
+
+class Precompressed:
+    """
+    A payload compressed once, with its CRC computed once (see precompress()).
+    It can be written any number of times under different names - with
+    write_raw_member(zout, p.info, p.raw, arcname) or as an entry for
+    stream_zip() - at the cost of a header + a plain copy per entry.
+    """
+
+    def __init__(self, info: zipfile.ZipInfo, raw: bytes):
+        self.info = info
+        self.raw = raw
+
+
+def precompress(data: bytes, compression=zipfile.ZIP_DEFLATED, date_time=None) -> Precompressed:
+    """
+    Compress `data` the way ZipFile.writestr() would, but only once.
+    """
+    info = zipfile.ZipInfo("", date_time or time.localtime(time.time())[:6])
+    info.compress_type = compression
+    info.external_attr = 0o600 << 16  # same default as writestr()
+    info.file_size = len(data)
+    info.CRC = zlib.crc32(data) & 0xFFFFFFFF
+    if compression == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        raw = compressor.compress(data) + compressor.flush()
+    elif compression == zipfile.ZIP_STORED:
+        raw = bytes(data)
+    else:
+        raise ValueError(f"Unsupported compression for precompress(): {compression}")
+    info.compress_size = len(raw)
+    return Precompressed(info, raw)
+
+
+class _StreamSink:
+    # Write-only file object for ZipFile: collects what was written until drained.
+    # No tell()/seek(), so zipfile switches to streaming mode (data descriptors).
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED):
+    """
+    Build a ZIP archive lazily and yield it chunk by chunk.
+
+    `entries` is an iterable of (arcname, data) where data is bytes (compressed
+    with `compression`), a RawMember or a Precompressed (both copied without
+    recompressing).
+    Each entry is yielded as soon as it is written, so only one entry is held
+    in memory at a time - suitable for StreamingHttpResponse.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", compression) as zout:
+        for arcname, data in entries:
+            if isinstance(data, RawMember):
+                copy_member(data.zf, data.info, zout, arcname)
+            elif isinstance(data, Precompressed):
+                write_raw_member(zout, data.info, data.raw, arcname)
+            else:
+                zout.writestr(arcname, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # central directory
+    tail = sink.drain()
+    if tail:
+        yield tail
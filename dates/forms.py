@@ -1,8 +1,35 @@
 # dates/forms.py
 from django import forms
 
+from .utils import parse_column_pairs
+
 class EarliestDateForm(forms.Form):
-    excel_file      = forms.FileField(label="Excel File (.xlsx)")
+    excel_file      = forms.FileField(label="Excel (.xlsx) or CSV File",
+                                      help_text="Large registers are read in chunks; CSV delimiter is detected.")
     skip_rows       = forms.IntegerField(min_value=0, initial=0, label="Header Rows to Skip")
     crit_col_letter = forms.CharField(max_length=3, label="Criteria Column Letter (e.g. B)")
     date_col_letter = forms.CharField(max_length=3, label="Date Column Letter (e.g. D)")
+    more_pairs      = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={"rows": 3}),
+        label="More Column Pairs (optional)",
+        help_text="One criteria,date pair per line (e.g. C,E) - all reports come from one read of the workbook."
+    )
+    sheets          = forms.CharField(
+        required=False,
+        max_length=500,
+        label="Sheets (optional)",
+        help_text="Comma-separated sheet names; blank = first sheet, * = every sheet (ignored for CSV)."
+    )
+
+    def clean(self):
+        # all (criteria, date) pairs, the first one from the two letter fields
+        cleaned_data = super().clean()
+        crit, date = cleaned_data.get("crit_col_letter"), cleaned_data.get("date_col_letter")
+        if crit and date:
+            try:
+                cleaned_data["column_pairs"] = parse_column_pairs(f"{crit},{date}\n{cleaned_data.get('more_pairs') or ''}")
+            except ValueError as e:
+                self.add_error("more_pairs", str(e))
+        cleaned_data["sheet_list"] = [s.strip() for s in (cleaned_data.get("sheets") or "").split(",") if s.strip()]
+        return cleaned_data
@@ -1,8 +1,14 @@
 # dates/utils.py
+import os
 import string
 from io import BytesIO
+import numpy as np
+import openpyxl
 import pandas as pd
 
+from core.csv_utils import sniff_delimiter
+from core.date_utils import parse_dates
+
 def col_letter_to_index(letter: str) -> int:
     letter = letter.strip().upper()
     idx = 0
@@ -13,29 +19,253 @@ def col_letter_to_index(letter: str) -> int:
             raise ValueError(f"Invalid column letter: {letter}")
     return idx - 1
 
+DATE_FORMAT = "%d.%m.%Y"
+
+
+def parse_column_pairs(text: str) -> list:
+    """
+    "B,D" / "B:D" per line (or separated by ";") -> [("B", "D"), ...]
+    (criteria column, date column).
+    """
+    pairs = []
+    for chunk in text.replace(";", "\n").splitlines():
+        if not chunk.strip():
+            continue
+        parts = [p.strip().upper() for p in chunk.replace(":", ",").split(",")]
+        if len(parts) != 2 or not all(parts):
+            raise ValueError(f"Invalid column pair: {chunk.strip()!r} (expected e.g. B,D)")
+        for letter in parts:
+            col_letter_to_index(letter)  # raises for anything but letters
+        pairs.append(tuple(parts))
+    return pairs
+
+
+def aggregate_dates(criteria: pd.Series, dates: pd.Series, rows: pd.Series) -> pd.DataFrame:
+    """
+    One groupby pass over rows with a valid date: per criteria value the
+    earliest and latest date, how many dates it has and the first/last
+    spreadsheet row it appears in. Criteria are categoricals, so the grouping
+    works on integer codes instead of hashing every string.
+    """
+    frame = pd.DataFrame({
+        "crit": criteria.astype("category"),
+        "date": dates,
+        "row": rows,
+    })
+    frame = frame[frame["date"].notna()]
+    return frame.groupby("crit", observed=True, sort=True).agg(
+        earliest=("date", "min"),
+        latest=("date", "max"),
+        count=("date", "count"),
+        first_row=("row", "min"),
+        last_row=("row", "max"),
+    )
+
+
+def _report(sheet: str, crit: str, date: str, summary: pd.DataFrame, invalid_dates: int) -> dict:
+    # aggregate_dates() result -> one report dict (see extract_date_reports)
+    report = {
+        "sheet": sheet,
+        "criteria_col": crit,
+        "date_col": date,
+        "invalid_dates": invalid_dates,
+        "rows": [],
+        "error": None,
+    }
+    if summary is None or summary.empty:
+        report["error"] = "No valid dates found in the specified column."
+        return report
+    report["rows"] = [
+        {
+            "criteria": key,
+            "earliest": agg["earliest"].strftime(DATE_FORMAT),
+            "latest": agg["latest"].strftime(DATE_FORMAT),
+            "count": int(agg["count"]),
+            "first_row": int(agg["first_row"]),
+            "last_row": int(agg["last_row"]),
+        }
+        for key, agg in summary.to_dict("index").items()
+    ]
+    return report
+
+
+def extract_date_reports(
+    excel_file,          # path, bytes or file-like object of the .xlsx
+    skip_rows: int,
+    column_pairs: list,  # [(criteria column letter, date column letter), ...]
+    sheets: list = None  # sheet names; None = first sheet, ["*"] = every sheet
+) -> list:
+    """
+    1) Reads the workbook once: every requested sheet, only the columns that
+       appear in column_pairs.
+    2) For every sheet and every (criteria, date) pair runs aggregate_dates().
+    3) Returns one report per sheet and pair, in request order:
+         {"sheet", "criteria_col", "date_col", "invalid_dates",
+          "rows": [{"criteria", "earliest", "latest", "count", "first_row", "last_row"}],
+          "error": message or None}
+       A pair without any valid date gets an error instead of rows; the other
+       reports are still returned.
+    """
+    if isinstance(excel_file, (bytes, bytearray)):
+        excel_file = BytesIO(excel_file)
+    if not column_pairs:
+        raise ValueError("At least one (criteria, date) column pair is required.")
+    indexed = [(crit, date, col_letter_to_index(crit), col_letter_to_index(date)) for crit, date in column_pairs]
+    usecols = sorted({i for _, _, crit_idx, date_idx in indexed for i in (crit_idx, date_idx)})
+
+    if not sheets:
+        sheet_name = [0]
+    elif "*" in sheets:
+        sheet_name = None
+    else:
+        sheet_name = list(sheets)
+
+    # ---- 1) One read of the workbook: {sheet: DataFrame with columns = usecols indexes} ----
+    frames = pd.read_excel(excel_file, sheet_name=sheet_name, header=None, skiprows=skip_rows, usecols=usecols)
+
+    # ---- 2) One groupby per (sheet, pair) ----
+    reports = []
+    for sheet, df in frames.items():
+        # 1-based spreadsheet row of every DataFrame row
+        rows = pd.Series(range(skip_rows + 1, skip_rows + 1 + len(df)), index=df.index)
+        parsed = {}  # a date column shared by several pairs is parsed once
+        for crit, date, crit_idx, date_idx in indexed:
+            if date_idx not in parsed:
+                parsed[date_idx] = parse_dates(df[date_idx])  # text (day first), Excel dates and serials
+            dates = parsed[date_idx]
+            summary = aggregate_dates(df[crit_idx].astype(str), dates, rows)
+            reports.append(_report(sheet if isinstance(sheet, str) else f"Sheet {sheet + 1}", crit, date,
+                                   summary, int(dates.isna().sum())))
+    return reports
+
+
+# ---- Chunked reading for registers too large for one DataFrame ----
+
+CHUNK_ROWS = 100_000  # rows per chunk (CSV and XLSX)
+CSV_SUFFIXES = (".csv", ".txt")
+
+
+def is_csv(source) -> bool:
+    # upload / path / file object -> True for a CSV register (by its name)
+    return str(getattr(source, "name", source)).lower().endswith(CSV_SUFFIXES)
+
+
+def _iter_csv_chunks(source, skip_rows: int, usecols: list, chunk_rows: int):
+    # pandas' chunked reader: only `usecols`, everything as text (serials too)
+    reader = pd.read_csv(source, sep=sniff_delimiter(source), header=None, skiprows=skip_rows,
+                         usecols=usecols, dtype=str, chunksize=chunk_rows, encoding_errors="replace")
+    with reader:
+        yield from reader
+
+
+def _iter_xlsx_chunks(worksheet, skip_rows: int, usecols: list, chunk_rows: int):
+    # openpyxl's read-only row iterator, cut into DataFrames of chunk_rows rows
+    def frame(rows):
+        df = pd.DataFrame(rows, columns=usecols, dtype=object)
+        return df.where(df.notna(), np.nan)  # empty cells as NaN, like read_excel
+
+    rows = []
+    for row in worksheet.iter_rows(min_row=skip_rows + 1, values_only=True):
+        rows.append(tuple(row[i] if i < len(row) else None for i in usecols))
+        if len(rows) >= chunk_rows:
+            yield frame(rows)
+            rows = []
+    if rows:
+        yield frame(rows)
+
+
+def _merge_summaries(running: pd.DataFrame, chunk: pd.DataFrame) -> pd.DataFrame:
+    # fold one chunk's aggregate_dates() into the running one: a row per
+    # criteria value, whatever the number of rows read so far
+    chunk.index = chunk.index.astype(object)  # categories differ from chunk to chunk
+    if running is None:
+        return chunk
+    return pd.concat([running, chunk]).groupby(level=0, sort=True).agg(
+        {"earliest": "min", "latest": "max", "count": "sum", "first_row": "min", "last_row": "max"}
+    )
+
+
+def _aggregate_chunks(chunks, skip_rows: int, indexed: list) -> list:
+    # running summary + invalid-date count per pair over all chunks of one sheet
+    summaries = [None] * len(indexed)
+    invalid = [0] * len(indexed)
+    offset = skip_rows
+    for df in chunks:
+        rows = pd.Series(range(offset + 1, offset + 1 + len(df)), index=df.index)
+        offset += len(df)
+        parsed = {}  # a date column shared by several pairs is parsed once per chunk
+        for i, (_, _, crit_idx, date_idx) in enumerate(indexed):
+            if date_idx not in parsed:
+                parsed[date_idx] = parse_dates(df[date_idx])
+            dates = parsed[date_idx]
+            invalid[i] += int(dates.isna().sum())
+            summary = aggregate_dates(df[crit_idx].astype(str), dates, rows)
+            if not summary.empty:
+                summaries[i] = _merge_summaries(summaries[i], summary)
+    return list(zip(summaries, invalid))
+
+
+def stream_date_reports(
+    source,              # path or file-like object of a .csv or .xlsx register
+    skip_rows: int,
+    column_pairs: list,  # [(criteria column letter, date column letter), ...]
+    sheets: list = None, # XLSX only: sheet names; None = first sheet, ["*"] = every sheet
+    chunk_rows: int = CHUNK_ROWS
+) -> list:
+    """
+    Same reports as extract_date_reports(), for registers too large to load
+    at once:
+    1) CSV is read with pandas' chunksize (delimiter sniffed), XLSX row by
+       row through openpyxl's read-only iterator - chunk_rows rows at a time,
+       only the columns in column_pairs.
+    2) Every chunk is aggregated (aggregate_dates) and folded into a running
+       summary per pair, so memory grows with the number of distinct criteria
+       values, not with the number of rows.
+    """
+    if not column_pairs:
+        raise ValueError("At least one (criteria, date) column pair is required.")
+    indexed = [(crit, date, col_letter_to_index(crit), col_letter_to_index(date)) for crit, date in column_pairs]
+    usecols = sorted({i for _, _, crit_idx, date_idx in indexed for i in (crit_idx, date_idx)})
+
+    if is_csv(source):
+        label = os.path.basename(str(getattr(source, "name", source))) or "CSV"
+        results = [(label, _aggregate_chunks(_iter_csv_chunks(source, skip_rows, usecols, chunk_rows),
+                                             skip_rows, indexed))]
+    else:
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            if not sheets:
+                names = workbook.sheetnames[:1]
+            elif "*" in sheets:
+                names = workbook.sheetnames
+            else:
+                names = list(sheets)
+            results = []
+            for name in names:
+                if name not in workbook.sheetnames:
+                    raise ValueError(f"Worksheet named '{name}' not found")
+                chunks = _iter_xlsx_chunks(workbook[name], skip_rows, usecols, chunk_rows)
+                results.append((name, _aggregate_chunks(chunks, skip_rows, indexed)))
+        finally:
+            workbook.close()
+
+    return [
+        _report(sheet, crit, date, summary, invalid)
+        for sheet, per_pair in results
+        for (crit, date, _, _), (summary, invalid) in zip(indexed, per_pair)
+    ]
+
+
 def extract_earliest_dates(
     excel_bytes: bytes,
     skip_rows: int,
     crit_col_letter: str,
     date_col_letter: str
 ) -> dict:
-    # Load into DataFrame
-    stream = BytesIO(excel_bytes)
-    df = pd.read_excel(stream, header=None, skiprows=skip_rows)
-
-    # Convert column letters to indices
-    crit_idx = col_letter_to_index(crit_col_letter)
-    date_idx = col_letter_to_index(date_col_letter)
-
-    # Extract series
-    criteria = df.iloc[:, crit_idx].astype(str)
-    dates = pd.to_datetime(df.iloc[:, date_idx], dayfirst=True, errors='coerce')
-    if dates.isna().all():
-        raise ValueError("No valid dates found in the specified column.")
-
-    # Group & pick earliest
-    grouped = pd.DataFrame({'crit': criteria, 'date': dates})
-    earliest = grouped.groupby('crit', as_index=True)['date'].min()
-
-    # Format output
-    return {k: v.strftime("%d.%m.%Y") for k, v in earliest.items()}
+    """
+    Single pair, first sheet: {criteria: earliest date as dd.mm.yyyy}.
+    """
+    report = extract_date_reports(excel_bytes, skip_rows, [(crit_col_letter, date_col_letter)])[0]
+    if report["error"]:
+        raise ValueError(report["error"])
+    return {row["criteria"]: row["earliest"] for row in report["rows"]}
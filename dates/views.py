@@ -5,7 +5,11 @@ from django.shortcuts import render
 from django.shortcuts import render
 from django.contrib import messages
 from .forms import EarliestDateForm
-from .utils import extract_earliest_dates
+from .utils import extract_date_reports, is_csv, stream_date_reports
+
+# Workbooks above this size are read row by row (openpyxl read-only) instead of
+# as a whole DataFrame.
+STREAM_XLSX_BYTES = 20 * 1024 * 1024
 
 def earliest_dates_view(request):
     result = None
@@ -13,12 +17,15 @@ def earliest_dates_view(request):
         form = EarliestDateForm(request.POST, request.FILES)
         if form.is_valid():
             try:
-                excel_bytes = request.FILES['excel_file'].read()
-                result = extract_earliest_dates(
-                    excel_bytes,
+                # every sheet and column pair in one read of the upload; CSV and big
+                # workbooks are read in chunks, keeping only a running summary per pair
+                upload = request.FILES['excel_file']
+                extract = stream_date_reports if is_csv(upload) or upload.size > STREAM_XLSX_BYTES else extract_date_reports
+                result = extract(
+                    upload,
                     form.cleaned_data['skip_rows'],
-                    form.cleaned_data['crit_col_letter'],
-                    form.cleaned_data['date_col_letter']
+                    form.cleaned_data['column_pairs'],
+                    form.cleaned_data['sheet_list']
                 )
             except Exception as e:
                 messages.error(request, str(e))
@@ -1,3 +1,17 @@
 from django.contrib import admin
+from .models import ReplaceJob
 
 # Register your models here.
+@admin.register(ReplaceJob)
+class ReplaceJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'filename_pattern', 'output', 'wall_seconds', 'spanning')
+    search_fields = ('filename_pattern',)
+    readonly_fields = ('report', 'logs')
+
+    @admin.display(description='Wall time (s)')
+    def wall_seconds(self, obj):
+        return obj.report.get('wall')
+
+    @admin.display(description='Spanning-run replacements')
+    def spanning(self, obj):
+        return obj.report.get('spanning')
@@ -0,0 +1,255 @@
+# docx_replace/benchmarks.py
+#
+# Synthetic corpus generator + stage timings for batch_find_replace.
+# Run through the management command:
+#   python manage.py bench_docx_replace --docs 200 --placeholders 30 --output bench.json
+# Results are plain JSON so runs from different commits can be diffed/compared.
+
+import io
+import os
+import json
+import time
+import random
+import struct
+import zlib
+import zipfile
+import platform
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+from docx import Document
+from docx.shared import Inches
+
+from core.zip_utils import stream_zip
+from . import utils
+
+DEFAULT_PATTERN = "Bench TS{id}.docx"
+
+
+def col_letter(idx: int) -> str:
+    """
+    Zero-based column index -> Excel letters (inverse of col_letter_to_index).
+    """
+    letters = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+
+def _noise_png(size_kb: int, rng: random.Random) -> bytes:
+    # Grayscale PNG filled with noise, so it does not compress: the file ends
+    # up about size_kb large, like a real photo embedded in a protocol.
+    side = max(8, int((size_kb * 1024) ** 0.5))
+    raw = b"".join(b"\x00" + rng.randbytes(side) for _ in range(side))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 0, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+
+def _add_placeholder(paragraph, placeholder, fragmentation, rng):
+    # with probability `fragmentation` split the placeholder over 2-3 runs,
+    # the way Word does after spell-check or partial formatting
+    if len(placeholder) > 2 and rng.random() < fragmentation:
+        cuts = sorted(rng.sample(range(1, len(placeholder)), min(2, len(placeholder) - 1)))
+        bounds = [0] + cuts[:rng.randint(1, len(cuts))] + [len(placeholder)]
+        for a, b in zip(bounds, bounds[1:]):
+            paragraph.add_run(placeholder[a:b])
+    else:
+        paragraph.add_run(placeholder)
+
+
+def make_template(placeholders, table_density=0.3, fragmentation=0.2, image_kb=0, seed=0) -> bytes:
+    """
+    Build one template DOCX containing every placeholder once.
+
+    - table_density: share of placeholders put into table cells (0..1)
+    - fragmentation: share of placeholders split across runs (0..1)
+    - image_kb: size of an embedded (incompressible) image, 0 = none
+    """
+    rng = random.Random(seed)
+    doc = Document()
+    doc.add_heading("PROCES VERBAL / MINUTE", level=1)
+
+    in_table = [p for p in placeholders if rng.random() < table_density]
+    in_body = [p for p in placeholders if p not in in_table]
+
+    for placeholder in in_body:
+        para = doc.add_paragraph()
+        para.add_run("Lorem ipsum dolor sit amet: ")
+        _add_placeholder(para, placeholder, fragmentation, rng)
+        para.add_run(" consectetur adipiscing elit.")
+
+    if in_table:
+        table = doc.add_table(rows=len(in_table), cols=3)
+        for row, placeholder in zip(table.rows, in_table):
+            row.cells[0].text = "Camp / Field"
+            _add_placeholder(row.cells[1].paragraphs[0], placeholder, fragmentation, rng)
+            row.cells[2].text = "-"
+
+    if image_kb:
+        doc.add_picture(io.BytesIO(_noise_png(image_kb, rng)), width=Inches(4))
+
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def make_corpus(docs=50, placeholders=20, table_density=0.3, fragmentation=0.2, image_kb=0,
+                filename_pattern=DEFAULT_PATTERN, seed=0):
+    """
+    Synthetic job input, shaped like a docxcloner batch: `docs` identical
+    DOCX files in a ZIP plus an Excel sheet with one row per ID.
+    Returns dict(docx_zip, excel, replacements, filename_pattern, start_id, end_id).
+    Column A holds the ID; every placeholder has its own column, every
+    fourth one holding dates.
+    """
+    rng = random.Random(seed)
+    names = [f"{{{{field{i:03d}}}}}" for i in range(placeholders)]
+    template = make_template(names, table_density, fragmentation, image_kb, seed)
+
+    zbuf = io.BytesIO()
+    with zipfile.ZipFile(zbuf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for doc_id in range(1, docs + 1):
+            zf.writestr(filename_pattern.format(id=doc_id), template)
+
+    base = datetime(2025, 1, 1)
+    rows = []
+    for doc_id in range(1, docs + 1):
+        row = [doc_id]
+        for i in range(placeholders):
+            if i % 4 == 3:
+                row.append(base + timedelta(days=rng.randint(0, 365)))
+            else:
+                row.append(f"value {doc_id}-{i} {rng.randint(0, 99999)}")
+        rows.append(row)
+    xbuf = io.BytesIO()
+    pd.DataFrame(rows).to_excel(xbuf, header=False, index=False)
+
+    return {
+        "docx_zip": zbuf.getvalue(),
+        "excel": xbuf.getvalue(),
+        "replacements": [[name, col_letter(i + 1)] for i, name in enumerate(names)],
+        "filename_pattern": filename_pattern,
+        "start_id": 1,
+        "end_id": docs,
+    }
+
+
+@contextmanager
+def _timed(stages, name):
+    # accumulate wall time of a stage across documents
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - t0
+
+
+def time_stages(corpus) -> dict:
+    """
+    Run the python-docx pipeline step by step (no caching, no pool) and
+    return (seconds per stage: unzip, excel, open, replace, save, zip;
+    size of the output ZIP in bytes).
+    """
+    timings = {}
+    with _timed(timings, "excel"):
+        id_to_values = utils.load_id_values(io.BytesIO(corpus["excel"]), 0, "A", corpus["replacements"])
+    pattern = utils.compile_rules(name for name, _ in corpus["replacements"])
+
+    outputs = []
+    with zipfile.ZipFile(io.BytesIO(corpus["docx_zip"])) as zin:
+        for doc_id in range(corpus["start_id"], corpus["end_id"] + 1):
+            fname = corpus["filename_pattern"].format(id=doc_id)
+            with _timed(timings, "unzip"):
+                src = zin.read(fname)
+            with _timed(timings, "open"):
+                doc = Document(io.BytesIO(src))
+            with _timed(timings, "replace"):
+                values = id_to_values[doc_id]
+                for container in utils.iter_story_containers(doc):
+                    for para in utils.iter_paragraphs(container):
+                        utils.replace_in_paragraph(para, pattern, values)
+            with _timed(timings, "save"):
+                out = io.BytesIO()
+                doc.save(out)
+            outputs.append((fname, out.getvalue()))
+
+    with _timed(timings, "zip"):
+        size = sum(len(chunk) for chunk in stream_zip(outputs))
+    return {name: round(seconds, 6) for name, seconds in timings.items()}, size
+
+
+def time_end_to_end(corpus, engine=utils.ENGINE_DOCX, workers=1) -> float:
+    """
+    Wall time of a full batch_find_replace() call.
+    """
+    utils.clear_template_cache()  # every run starts cold
+    t0 = time.perf_counter()
+    utils.batch_find_replace(
+        io.BytesIO(corpus["excel"]), 0, "A", corpus["filename_pattern"],
+        corpus["start_id"], corpus["end_id"], corpus["replacements"], corpus["docx_zip"],
+        workers=workers, engine=engine,
+    )
+    return round(time.perf_counter() - t0, 6)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(docs=50, placeholders=20, table_density=0.3, fragmentation=0.2, image_kb=0,
+                  engines=utils.ENGINES, workers=1, repeat=1, seed=0) -> dict:
+    """
+    Generate a corpus, time each stage of the python-docx pipeline and the
+    end-to-end batch for every engine. Returns a JSON-serializable dict;
+    with repeat > 1 the best (minimum) time of each measurement is kept.
+    """
+    # record the pool size that actually runs: the batch clamps it to the CPU count
+    effective_workers = utils._worker_count(workers)
+    config = {
+        "docs": docs, "placeholders": placeholders, "table_density": table_density,
+        "fragmentation": fragmentation, "image_kb": image_kb, "workers": effective_workers,
+        "workers_requested": workers, "repeat": repeat, "seed": seed,
+    }
+    corpus = make_corpus(docs, placeholders, table_density, fragmentation, image_kb, seed=seed)
+
+    stage_runs = [time_stages(corpus) for _ in range(repeat)]
+    stages = {name: min(run[name] for run, _ in stage_runs) for name in stage_runs[0][0]}
+    end_to_end = {
+        engine: min(time_end_to_end(corpus, engine, effective_workers) for _ in range(repeat))
+        for engine in engines
+    }
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": config,
+        "input_bytes": {"docx_zip": len(corpus["docx_zip"]), "excel": len(corpus["excel"])},
+        "output_bytes": stage_runs[0][1],
+        "stages": stages,
+        "end_to_end": end_to_end,
+    }
+
+
+def write_results(results: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
@@ -1,7 +1,18 @@
 # docx_replace/forms.py
+import os
+
 from django import forms
+from .models import ReplaceJob
+from .utils import pattern_fields
 
 # We’ll parse replacements via ast.literal_eval in the view.
+# Instead of a column letter a rule can compute its text (see utils.DerivedColumn):
+DERIVED_RULES_HELP = (
+    "Instead of a column letter a rule can compute its value: "
+    "{\"template\": \"{B} {C}\"} joins columns; {\"col\": \"C\", \"add_days\": 30, \"date_format\": \"%d.%m.%Y\"} shifts a date; "
+    "{\"col\": \"D\", \"number_format\": \",.2f\"} formats numbers; add \"fallback\": \"E\" or \"default\": \"-\" for empty cells."
+)
+
 class ReplaceForm(forms.Form):
     excel_file = forms.FileField(label="Upload Source EXCEL (.xlsx)", help_text='Example: Laying and connection of LV AC Cables 14Jul2025.xlsx')
     docx_zip   = forms.FileField(label="Upload DOCX Target Files ZIP archive", help_text='Example: cloned_files(3).zip')
@@ -10,15 +21,86 @@ class ReplaceForm(forms.Form):
     id_col_letter   = forms.CharField(max_length=2, initial="A", label="ID column (e.g. G)", help_text='Column you use to match ID from Excel to ID from Word')
     filename_pattern = forms.CharField(
         label="Input pattern of DOCX filename + {id}",
-        help_text="Use {id} placeholder, e.g. '6 Proces Verbal Lucrare Calitativa Impamantare TS{id}.docx'"
+        help_text="Use {id} placeholder (or e.g. {id:03d} for zero-padded numbers), e.g. '6 Proces Verbal Lucrare Calitativa Impamantare TS{id}.docx'"
+    )
+    start_id        = forms.IntegerField(label="Starting number for {id}", required=False)
+    end_id          = forms.IntegerField(label="Ending number for {id}", required=False,
+                                         help_text = "Explanation: this is the range of files which you will edit. "
+                                                     "Leave both empty to edit every file whose ID is also in the Excel file")
+
+    replacements = forms.CharField(
+        widget=forms.Textarea,
+        label="Replace rules",
+        help_text="\nThis is a list of words/phrases that you will replace - Use format JSON list of ['find_text', 'col_letter'], e.g. [[\"name\",\"B\"],[\"date\",\"C\"]]. "
+                  + DERIVED_RULES_HELP
+    )
+    extra_templates = forms.CharField(
+        widget=forms.Textarea, required=False,
+        label="More templates per ID (optional)",
+        help_text="Other DOCX files of the same ZIP filled from the same Excel row, each with its own rules: "
+                  "JSON list of ['filename pattern', rules], e.g. [[\"7 PV Receptie TS{id}.docx\", [[\"name\",\"B\"]]]]"
+    )
+    engine = forms.ChoiceField(
+        choices=[("docx", "python-docx (load whole document)"), ("xml", "Raw XML (faster on image-heavy files)")],
+        initial="docx", required=False, label="Replacement engine",
+        help_text="Raw XML only rewrites the text of body, headers and footers (same text parts as python-docx); "
+                  "every other part (images, styles, settings, rels) is copied from the source as-is"
+    )
+    workers = forms.IntegerField(
+        min_value=0, max_value=os.cpu_count() or 1, initial=1, required=False, label="Parallel workers",
+        help_text="1 = one document at a time; more = process pool of that size; 0 = one per CPU core"
     )
-    start_id        = forms.IntegerField(label="Starting number for {id}")
-    end_id          = forms.IntegerField(label="Ending number for {id}",
-                                         help_text = "Explanation: this is the range of files which you will edit")
+    base_job = forms.ModelChoiceField(
+        queryset=ReplaceJob.objects.order_by('-created_at'), required=False,
+        label="Incremental re-run of job",
+        help_text="Only documents whose template, rules or Excel values changed are regenerated; the rest are copied from this job's ZIP"
+    )
+
+
+    def clean_filename_pattern(self):
+        pattern = self.cleaned_data['filename_pattern']
+        # {id} or {id:<format spec>} (e.g. TS{id:03d}.docx), nothing else
+        try:
+            pattern_fields(pattern)
+        except ValueError as e:
+            raise forms.ValidationError(f"{e}. The {{id}} placeholder is how files are matched to Excel rows.")
+        return pattern
+
+
+class GenerateForm(forms.Form):
+    # One template + Excel rows -> one filled DOCX per row, no cloning round-trip
+    template_file = forms.FileField(label="Upload template DOCX", help_text='Example: 6 Proces Verbal Lucrare Calitativa Impamantare TS1.docx')
+    excel_file    = forms.FileField(label="Upload Source EXCEL (.xlsx)", help_text='Example: Laying and connection of LV AC Cables 14Jul2025.xlsx')
+
+    header_rows    = forms.IntegerField(min_value=0, initial=0, label="Header rows to skip", help_text='Top rows to ignore in Excel file')
+    id_col_letter  = forms.CharField(max_length=2, initial="A", label="ID column (e.g. G)")
+    output_pattern = forms.CharField(
+        label="Output DOCX filename + {id}",
+        help_text="Use {id} placeholder (or e.g. {id:03d} for zero-padded numbers), e.g. '6 Proces Verbal Lucrare Calitativa Impamantare TS{id}.docx'"
+    )
+    start_id = forms.IntegerField(label="Starting number for {id}", required=False)
+    end_id   = forms.IntegerField(label="Ending number for {id}", required=False,
+                                  help_text="One document is generated per Excel row in this range (empty = no limit)")
 
     replacements = forms.CharField(
         widget=forms.Textarea,
         label="Replace rules",
-        help_text="\nThis is a list of words/phrases that you will replace - Use format JSON list of ['find_text', 'col_letter'], e.g. [[\"name\",\"B\"],[\"date\",\"C\"]]"
+        help_text="JSON list of ['find_text', 'col_letter'], e.g. [[\"name\",\"B\"],[\"date\",\"C\"]]. "
+                  + DERIVED_RULES_HELP
+    )
+    engine = forms.ChoiceField(
+        choices=[("xml", "Raw XML (fastest)"), ("docx", "python-docx")],
+        initial="xml", required=False, label="Replacement engine",
+        help_text="Both give the same body/header/footer text; Raw XML copies every other part "
+                  "(images, styles, settings, rels) from the template as-is, python-docx rewrites them"
     )
-    
+    workers = forms.IntegerField(
+        min_value=0, max_value=os.cpu_count() or 1, initial=1, required=False, label="Parallel workers",
+        help_text="1 = one document at a time; more = process pool of that size; 0 = one per CPU core"
+    )
+
+    def clean_output_pattern(self):
+        pattern = self.cleaned_data['output_pattern']
+        if "{id}" not in pattern:
+            raise forms.ValidationError("The output filename must contain {id}, otherwise every document gets the same name.")
+        return pattern
@@ -0,0 +1,49 @@
+# docx_replace/management/commands/bench_docx_replace.py
+import os
+import json
+
+from django.core.management.base import BaseCommand
+
+from docx_replace import benchmarks
+from docx_replace.utils import ENGINES
+
+
+class Command(BaseCommand):
+    help = "Benchmark batch_find_replace on a synthetic corpus and write the timings as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs", type=int, default=50, help="documents in the ZIP")
+        parser.add_argument("--placeholders", type=int, default=20, help="placeholders per document")
+        parser.add_argument("--table-density", type=float, default=0.3, help="share of placeholders in table cells (0..1)")
+        parser.add_argument("--fragmentation", type=float, default=0.2, help="share of placeholders split across runs (0..1)")
+        parser.add_argument("--image-kb", type=int, default=0, help="size of an embedded image per document")
+        parser.add_argument("--engine", action="append", choices=ENGINES, help="engine(s) to time end-to-end (default: all)")
+        parser.add_argument("--workers", type=int, default=1, help="process pool size for the end-to-end runs")
+        parser.add_argument("--repeat", type=int, default=1, help="repeat each measurement, keep the best")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="write results to this JSON file (default: print)")
+        parser.add_argument("--save-corpus", metavar="DIR", help="also write the generated ZIP and Excel to DIR")
+
+    def handle(self, *args, **opts):
+        if opts["save_corpus"]:
+            corpus = benchmarks.make_corpus(
+                opts["docs"], opts["placeholders"], opts["table_density"],
+                opts["fragmentation"], opts["image_kb"], seed=opts["seed"],
+            )
+            os.makedirs(opts["save_corpus"], exist_ok=True)
+            with open(os.path.join(opts["save_corpus"], "corpus.zip"), "wb") as f:
+                f.write(corpus["docx_zip"])
+            with open(os.path.join(opts["save_corpus"], "corpus.xlsx"), "wb") as f:
+                f.write(corpus["excel"])
+            self.stdout.write(f"Replace rules: {corpus['replacements']}")
+
+        results = benchmarks.run_benchmark(
+            docs=opts["docs"], placeholders=opts["placeholders"], table_density=opts["table_density"],
+            fragmentation=opts["fragmentation"], image_kb=opts["image_kb"],
+            engines=opts["engine"] or ENGINES, workers=opts["workers"], repeat=opts["repeat"], seed=opts["seed"],
+        )
+        if opts["output"]:
+            benchmarks.write_results(results, opts["output"])
+            self.stdout.write(self.style.SUCCESS(f"Results written to {opts['output']}"))
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
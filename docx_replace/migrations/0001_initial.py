@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplaceJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('filename_pattern', models.CharField(max_length=255)),
+                ('output', models.FileField(upload_to='docx_replace/jobs/')),
+                ('fingerprints', models.JSONField(default=dict)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docx_replace', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replacejob',
+            name='logs',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='replacejob',
+            name='report',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,3 +1,40 @@
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 # Create your models here.
+
+# How many of the newest records (and their files under MEDIA_ROOT) are kept;
+# older ones are pruned whenever a new one is saved.
+KEEP_JOBS = getattr(settings, 'DOCX_REPLACE_KEEP_JOBS', 20)
+
+
+class ReplaceJob(models.Model):
+    # One finished batch_find_replace run: the ZIP it produced and, per output
+    # file, a fingerprint of everything that file was built from. A later run
+    # can reuse every output whose fingerprint did not change.
+    created_at       = models.DateTimeField(auto_now_add=True)
+    filename_pattern = models.CharField(max_length=255)
+    output           = models.FileField(upload_to='docx_replace/jobs/')
+    fingerprints     = models.JSONField(default=dict)   # {output filename: sha256}
+    report           = models.JSONField(default=dict, blank=True)  # JobReport.as_dict() + output_zip_bytes
+    logs             = models.TextField(blank=True)     # one log line per ID, as produced by the run
+
+    def __str__(self):
+        return f"#{self.pk} {self.filename_pattern} ({self.created_at:%d.%m.%Y %H:%M})"
+
+    @classmethod
+    def prune(cls, keep=None):
+        # delete all but the `keep` newest records; their files go with them (see below)
+        keep = KEEP_JOBS if keep is None else keep
+        stale = cls.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)[keep:]
+        return cls.objects.filter(pk__in=list(stale)).delete()
+
+
+@receiver(post_delete, sender=ReplaceJob)
+def delete_output_file(sender, instance, **kwargs):
+    # Deleting a record (admin, prune(), queryset.delete()) also removes its file,
+    # otherwise the job output ZIPs would pile up in MEDIA_ROOT forever.
+    if instance.output:
+        instance.output.delete(save=False)
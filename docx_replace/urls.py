@@ -1,12 +1,14 @@
 # docx_replace/urls.py
 from django.urls import path
-from .views import replace_view
+from .views import generate_view, replace_view, scan_view
 
 app_name = "docx_replace"
 
 urlpatterns = [
     #path("", replace_view, name="replace_docs"),
     path("", replace_view, name="replace_docs"),
+    path("generate/", generate_view, name="generate_docs"),
+    path("scan/", scan_view, name="scan_docs"),
 ]
 
 ## No app_name = … anywhere, and you’re including them without a namespace= argument. 
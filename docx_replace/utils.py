@@ -6,15 +6,141 @@ logger = logging.getLogger(__name__)
 
 
 import os
+import re
+import sys
+import math
+import copy
+import time
 import string
+import json
+import hashlib
 import zipfile
-import tempfile
+import threading
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
 from io import BytesIO
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
+try:
+    import resource  # peak memory of pool workers (ru_maxrss); not available on Windows
+except ImportError:
+    resource = None
+
+import numpy as np
 import pandas as pd
 from pandas import Timestamp
+from lxml import etree
 from docx import Document
+from docx.document import Document as DocumentObject
+from docx.blkcntnr import BlockItemContainer
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+from docx.text.paragraph import Paragraph
+
+from core.date_utils import parse_dates
+from core.zip_utils import RawMember, open_zip, read_raw_member, stream_zip, write_raw_member
+
+# replacement engines for batch_find_replace
+ENGINE_DOCX = "docx"  # load the whole package with python-docx
+ENGINE_XML = "xml"    # rewrite only the text parts, copy everything else raw
+ENGINES = (ENGINE_DOCX, ENGINE_XML)
+
+# parts that hold the document's w:t runs
+_TEXT_PART_TYPES = (CT.WML_DOCUMENT_MAIN, CT.WML_HEADER, CT.WML_FOOTER)
+
+def compile_rules(find_texts):
+    """
+    Compile every placeholder of a job into ONE alternation regex, so a
+    paragraph is searched once no matter how many rules there are.
+    Longer placeholders come first, so 'date_end' wins over 'date'.
+    Returns None when there is nothing to look for.
+    """
+    unique = sorted({t for t in find_texts if t}, key=len, reverse=True)
+    if not unique:
+        return None
+    return re.compile("|".join(re.escape(t) for t in unique))
+
+
+@lru_cache(maxsize=32)
+def _compiled_rules(find_texts: tuple):
+    # workers only receive plain values, so each process compiles (and caches) its own matcher
+    return compile_rules(find_texts)
+
+
+def find_matches(full_text, pattern):
+    """
+    Return [(start, end, placeholder), ...] for every match of `pattern`
+    in the paragraph's joined run text.
+    """
+    return [(m.start(), m.end(), m.group()) for m in pattern.finditer(full_text)]
+
+
+def rewrite_run_texts(texts, matches, values):
+    """
+    Resolve all `matches` (offsets into "".join(texts)) in one rewrite.
+    The replacement text goes into the run where the placeholder starts
+    (so it takes that run's formatting); the rest of a placeholder that
+    spills over into later runs is simply cut out of those runs.
+    Returns (new_texts, spanning) where `spanning` counts the placeholders
+    that crossed a run boundary.
+    """
+    new_texts = []
+    spanning = 0
+    m, n = 0, len(matches)
+    offset = 0
+    for text in texts:
+        run_start, run_end = offset, offset + len(text)
+        offset = run_end
+        pieces = []
+        pos = run_start
+        while pos < run_end:
+            # skip matches that are already fully behind us
+            while m < n and matches[m][1] <= pos:
+                m += 1
+            if m == n or matches[m][0] >= run_end:
+                pieces.append(text[pos - run_start:])
+                break
+            start, end, key = matches[m]
+            if start >= pos:
+                # placeholder starts in this run -> emit the replacement here
+                pieces.append(text[pos - run_start:start - run_start])
+                pieces.append(values[key])
+                if end > run_end:
+                    spanning += 1
+            # else: tail of a placeholder that started in an earlier run -> drop it
+            pos = min(end, run_end)
+        new_texts.append("".join(pieces))
+    return new_texts, spanning
+
+
+def _apply_matches(runs, texts, matches, values):
+    new_texts, spanning = rewrite_run_texts(texts, matches, values)
+    for run, old, new in zip(runs, texts, new_texts):
+        if new != old:
+            run.text = new
+    return len(matches), spanning
+
+
+def replace_in_paragraph(para, pattern, values):
+    """
+    Replace every placeholder matched by `pattern` inside `para` in a single
+    pass. `values` maps placeholder -> replacement text.
+    Only runs whose text actually changes are touched, so formatting is kept.
+    Returns (replaced, spanning) counts.
+    """
+    runs = para.runs
+    if not runs:
+        return 0, 0
+    texts = [r.text or "" for r in runs]
+    matches = find_matches("".join(texts), pattern)
+    if not matches:
+        return 0, 0
+    return _apply_matches(runs, texts, matches, values)
+
 
 def replace_placeholder_preserve_runs(para, placeholder, replacement):
     """
@@ -22,83 +148,649 @@ def replace_placeholder_preserve_runs(para, placeholder, replacement):
     without altering run objects (so formatting is preserved).
     Returns True if a replacement occurred, otherwise False.
     """
- 
-    runs = para.runs # Document module, calls the runs (segments with same style or formatting from a paragraph)
-    # doc = Document('example.docx') -> see explanation in tests.py
-    if not runs:
-        return False
+    pattern = re.compile(re.escape(placeholder))
+    replaced, _ = replace_in_paragraph(para, pattern, {placeholder: replacement})
+    return replaced > 0
 
-    # Build full text and record each run's length
-    lengths = []
-    parts = []
-    for r in runs:
-        text = r.text or ""
-        parts.append(text)
-        lengths.append(len(text))
-    full_text = "".join(parts)
 
-    if placeholder not in full_text:
-        return False
+def iter_paragraphs(container, _seen_cells=None):
+    """
+    Yield every paragraph of `container` (a Document or a table cell):
+    first its own paragraphs, then the ones inside its tables (nested
+    tables included).
+    Merged cells are yielded repeatedly by `row.cells`, so each underlying
+    <w:tc> is only visited once.
+    """
+    seen = set() if _seen_cells is None else _seen_cells
+    yield from container.paragraphs
+    for table in container.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                if cell._tc in seen:
+                    continue
+                seen.add(cell._tc)
+                yield from iter_paragraphs(cell, seen)
+
+
+def iter_story_containers(doc):
+    """
+    Yield the containers whose paragraphs get placeholders replaced:
+    the document body, then every header/footer part (each part once,
+    even when several sections link to it).
+    """
+    yield doc
+    seen = set()
+    for rel in doc.part.rels.values():
+        if rel.is_external or rel.reltype not in (RT.HEADER, RT.FOOTER):
+            continue
+        part = rel.target_part
+        if id(part) in seen:
+            continue
+        seen.add(id(part))
+        yield BlockItemContainer(part.element, None)
+
+
+def _text_part_names(zin):
+    """
+    Map member name -> content type for the document body, headers and
+    footers, as declared in [Content_Types].xml.
+    """
+    root = etree.fromstring(zin.read("[Content_Types].xml"))
+    names = {}
+    for override in root:
+        if etree.QName(override).localname != "Override":
+            continue
+        content_type = override.get("ContentType")
+        if content_type in _TEXT_PART_TYPES:
+            names[override.get("PartName").lstrip("/")] = content_type
+    return names
+
+
+def _find_hits(container, root, pattern):
+    """
+    Locate the placeholders of one story (body / header / footer).
+    Returns [(paragraph position, matches), ...] where the position indexes
+    root.iter(w:p) and matches are (start, end, placeholder) offsets into the
+    paragraph's joined run text - together with the run lengths this pins
+    down exactly which runs and offsets each placeholder occupies.
+    """
+    positions = {p: i for i, p in enumerate(root.iter(qn("w:p")))}
+    hits = []
+    for para in iter_paragraphs(container):
+        texts = [r.text or "" for r in para.runs]
+        matches = find_matches("".join(texts), pattern)
+        if matches:
+            hits.append((positions[para._p], matches))
+    return hits
+
+
+def _apply_hits(root, hits, values):
+    # no searching here: jump straight to the recorded paragraphs
+    paragraphs = list(root.iter(qn("w:p")))
+    replaced = spanning = 0
+    for pos, matches in hits:
+        runs = Paragraph(paragraphs[pos], None).runs
+        r, sp = _apply_matches(runs, [r.text or "" for r in runs], matches, values)
+        replaced += r
+        spanning += sp
+    return replaced, spanning
+
+
+class CompiledTemplate:
+    """
+    One template DOCX with its placeholder locations found up front, so that
+    filling it for another ID is only "apply values + serialize".
+
+    - python-docx engine: `stories` maps story index (iter_story_containers
+      order) -> hits; each apply still loads the package, but skips the search.
+    - raw-XML engine: `stories` maps part name -> (parsed part, hits) and the
+      untouched members are kept as raw compressed bytes, so each apply only
+      deep-copies the affected parts, patches the recorded runs and writes.
+    """
+
+    def __init__(self, src_bytes, pattern, engine=ENGINE_DOCX):
+        self.engine = engine
+        self.stories = {}
+        self.members = []  # xml engine: [(ZipInfo, raw bytes or None for rewritten parts)]
+        self._src_bytes = src_bytes
+        self.nbytes = len(src_bytes)  # rough memory footprint, for the template cache
+
+        if engine == ENGINE_XML:
+            with zipfile.ZipFile(BytesIO(src_bytes)) as zin:
+                for name, content_type in _text_part_names(zin).items():
+                    root = parse_xml(zin.read(name))
+                    body = root.body if content_type == CT.WML_DOCUMENT_MAIN else root
+                    hits = _find_hits(BlockItemContainer(body, None), root, pattern)
+                    if hits:
+                        self.stories[name] = (root, hits)
+                if self.stories:
+                    for info in zin.infolist():
+                        raw = None if info.filename in self.stories else read_raw_member(zin, info)
+                        self.members.append((info, raw))
+                        # parsed parts: counted at their uncompressed size (the tree is larger still)
+                        self.nbytes += len(raw) if raw is not None else info.file_size
+        else:
+            doc = Document(BytesIO(src_bytes))
+            for i, container in enumerate(iter_story_containers(doc)):
+                hits = _find_hits(container, _story_root(container), pattern)
+                if hits:
+                    self.stories[i] = hits
+
+    def apply(self, values):
+        """
+        Fill the template with `values` (placeholder -> text).
+        Returns (output_bytes or None when nothing changed, replaced, spanning).
+        """
+        if not self.stories:
+            return None, 0, 0
+        if self.engine == ENGINE_XML:
+            return self._apply_xml(values)
+
+        doc = Document(BytesIO(self._src_bytes))
+        replaced = spanning = 0
+        for i, container in enumerate(iter_story_containers(doc)):
+            if i in self.stories:
+                r, sp = _apply_hits(_story_root(container), self.stories[i], values)
+                replaced += r
+                spanning += sp
+        out = BytesIO()
+        doc.save(out)
+        return out.getvalue(), replaced, spanning
+
+    def _apply_xml(self, values):
+        replaced = spanning = 0
+        new_parts = {}
+        for name, (root, hits) in self.stories.items():
+            root = copy.deepcopy(root)
+            r, sp = _apply_hits(root, hits, values)
+            replaced += r
+            spanning += sp
+            new_parts[name] = serialize_part_xml(root)
+
+        out = BytesIO()
+        with zipfile.ZipFile(out, "w") as zout:
+            for info, raw in self.members:
+                if raw is None:
+                    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    zinfo.external_attr = info.external_attr
+                    zout.writestr(zinfo, new_parts[info.filename])
+                else:
+                    write_raw_member(zout, info, raw)
+        return out.getvalue(), replaced, spanning
+
+
+def _story_root(container):
+    # python-docx Document -> <w:document>; header/footer container -> <w:hdr>/<w:ftr>
+    return container.element if isinstance(container, DocumentObject) else container._element
+
+
+# LRU of compiled templates, keyed by (content hash, engine, placeholders).
+# Batches cloned from one template hit the same entry for every ID.
+# It lives as long as the process (each pool worker has its own), so it is
+# bounded by the templates' size, not only by their number: a few image-heavy
+# templates must not pin hundreds of MB between jobs.
+TEMPLATE_CACHE_SIZE = 16
+TEMPLATE_CACHE_BYTES = 64 * 1024 * 1024
+_template_cache = OrderedDict()
+_template_cache_bytes = 0
+_template_cache_lock = threading.Lock()
+
+
+def get_compiled_template(src_bytes, find_texts, engine=ENGINE_DOCX):
+    """
+    CompiledTemplate for `src_bytes`, compiled once per unique content hash
+    (and rule set) and kept in a small LRU cache (at most TEMPLATE_CACHE_SIZE
+    entries and TEMPLATE_CACHE_BYTES; the newest entry is always kept, so a
+    batch over one oversized template still compiles it only once).
+    """
+    global _template_cache_bytes
+    find_texts = tuple(find_texts)
+    key = (hashlib.sha256(src_bytes).hexdigest(), engine, tuple(sorted(find_texts)))
+    with _template_cache_lock:
+        template = _template_cache.get(key)
+        if template is not None:
+            _template_cache.move_to_end(key)
+            return template
+
+    template = CompiledTemplate(src_bytes, _compiled_rules(find_texts), engine)
+    with _template_cache_lock:
+        if key not in _template_cache:  # another thread may have compiled it meanwhile
+            _template_cache[key] = template
+            _template_cache_bytes += template.nbytes
+        while len(_template_cache) > 1 and (len(_template_cache) > TEMPLATE_CACHE_SIZE
+                                            or _template_cache_bytes > TEMPLATE_CACHE_BYTES):
+            _, evicted = _template_cache.popitem(last=False)
+            _template_cache_bytes -= evicted.nbytes
+    return template
 
-    # Replace in the combined text
-    new_text = full_text.replace(placeholder, replacement)
 
-    # Clear runs and re-slice new_text according to original run lengths
-    for r in runs:
-        r.text = ""
+def clear_template_cache():
+    global _template_cache_bytes
+    with _template_cache_lock:
+        _template_cache.clear()
+        _template_cache_bytes = 0
 
-    pos = 0
-    for r, ln in zip(runs, lengths):
-        if ln:
-            r.text = new_text[pos: pos + ln]
-            pos += ln
 
-    # Any leftover characters go to the last run (preserve formatting)
-    if pos < len(new_text):
-        runs[-1].text = (runs[-1].text or "") + new_text[pos:]
+def replace_in_docx(src_bytes, pattern, values):
+    """
+    python-docx engine: load the whole package, replace, save (no caching).
+    Returns (output_bytes or None when nothing changed, replaced, spanning).
+    """
+    return CompiledTemplate(src_bytes, pattern, ENGINE_DOCX).apply(values)
+
+
+def replace_in_docx_xml(src_bytes, pattern, values):
+    """
+    Raw-XML engine: open the DOCX as a plain ZIP, parse and rewrite only the
+    body/header/footer XML parts and copy every other member (media, styles,
+    fonts, ...) byte-for-byte without decompressing it.
+
+    The text parts go through python-docx's own oxml parser/serializer and the
+    same paragraph engine, so only those text parts come out byte-identical
+    to the python-docx path. The rest of the package is not: python-docx
+    re-serializes [Content_Types].xml, the rels, docProps/core.xml, settings
+    and styles, while this engine keeps the source's bytes.
+    Returns (output_bytes or None when nothing changed, replaced, spanning).
+    """
+    return CompiledTemplate(src_bytes, pattern, ENGINE_XML).apply(values)
+
+
+def format_cell(raw_val) -> str:
+    """
+    Excel cell -> replacement text (dates as dd.mm.yyyy, empty cells as "").
+    """
+    # NaT is also a datetime, so test for empty cells first
+    if pd.isna(raw_val):
+        return ""
+    if isinstance(raw_val, (Timestamp, datetime)):
+        return raw_val.strftime("%d.%m.%Y")
+    return str(raw_val)
+
+
+def format_column(series: pd.Series) -> list:
+    """
+    format_cell() for a whole column at once -> list of strings.
+    Typed columns (dates, numbers) are formatted with vectorized operations;
+    only mixed object columns fall back to a per-cell map.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime("%d.%m.%Y").fillna("").tolist()
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(str).where(series.notna(), "").tolist()
+    return series.map(format_cell).tolist()
+
+
+def _normalize_ids(ids: pd.Series) -> list:
+    # whole numbers become int (Excel hands them over as float), anything else stays as it is
+    if pd.api.types.is_integer_dtype(ids):
+        return ids.tolist()
+    if pd.api.types.is_float_dtype(ids):
+        whole = (ids % 1 == 0).tolist()
+        return [int(v) if w else v for v, w in zip(ids.tolist(), whole)]
+    return [int(v) if isinstance(v, (int, float)) and float(v).is_integer() else v
+            for v in ids.tolist()]
+
+
+# ---- Derived columns: rule values computed from one or more columns ----
+
+_COLUMN_REF = re.compile(r"\{([A-Za-z]{1,3})\}")
+
+
+class DerivedColumn:
+    """
+    Right-hand side of a rule that is computed instead of read from a single
+    column, e.g. ["{{period}}", {"template": "{B} - {C}"}]. It is evaluated
+    once per job over the whole sheet with vectorized pandas operations, so a
+    document still only does a dict lookup.
+
+    Spec keys (exactly one of "template" / "col"):
+    - template:      text with column references, "{B} {C}" (cells as format_cell)
+    - col:           one column, optionally with
+        add_days:      date arithmetic, e.g. 30 or -1 (the column is read as dates)
+        date_format:   strftime format of the date, default "%d.%m.%Y"
+        number_format: format spec of numbers, e.g. ",.2f" or "03d"; integer
+                       formats (d, x, ...) round halves away from zero (2.5 -> "003");
+                       not for date columns, nor together with the date keys
+    - fallback:      column whose text is used where the result is empty
+    - default:       text used where the result is still empty
+    """
+
+    KEYS = {"template", "col", "add_days", "date_format", "number_format", "fallback", "default"}
+
+    def __init__(self, spec: dict):
+        unknown = set(spec) - self.KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys in rule {spec}: {', '.join(sorted(unknown))}")
+        if ("template" in spec) == ("col" in spec):
+            raise ValueError(f"Rule {spec} needs exactly one of 'template' or 'col'")
+        # every value is checked here, so a typo fails before any row is read
+        # (and as ValueError, which the views show as a form error)
+        if "template" in spec:
+            if not isinstance(spec["template"], str):
+                raise ValueError(f"Rule template must be text: {spec['template']!r}")
+            if not _COLUMN_REF.search(spec["template"]):
+                raise ValueError(f"Rule template references no column: {spec['template']}")
+        for key in ("col", "fallback"):
+            if key in spec:
+                col_letter_to_index(spec[key])  # ValueError for anything but column letters
+        if "add_days" in spec:
+            add_days = spec["add_days"]
+            if isinstance(add_days, bool) or not isinstance(add_days, (int, float)) or not math.isfinite(add_days):
+                raise ValueError(f"Rule add_days must be a number of days: {add_days!r}")
+        if "number_format" in spec and ({"add_days", "date_format"} & set(spec)):
+            raise ValueError(f"Rule {spec} mixes number_format with date options")
+        # a bad format would otherwise give '' (numbers) or its own text (dates) on every row
+        if "number_format" in spec:
+            _check_number_format(spec["number_format"])
+        if "date_format" in spec:
+            _check_date_format(spec["date_format"])
+        self.spec = spec
+        self.key = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+
+    def __eq__(self, other):
+        return isinstance(other, DerivedColumn) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"DerivedColumn({self.key})"
+
+    def columns(self) -> set:
+        """
+        Column indexes the expression reads.
+        """
+        spec = self.spec
+        if "template" in spec:
+            letters = _COLUMN_REF.findall(spec["template"])
+        else:
+            letters = [spec["col"]]
+        if "fallback" in spec:
+            letters.append(spec["fallback"])
+        return {col_letter_to_index(letter) for letter in letters}
+
+    def evaluate(self, df: pd.DataFrame) -> list:
+        """
+        Text of the expression for every row of `df` (columns labelled by
+        index, as read by load_id_rows) -> list of strings.
+        """
+        spec = self.spec
+        if "template" in spec:
+            result = self._template(df, spec["template"])
+        else:
+            series = df[col_letter_to_index(spec["col"])]
+            if "add_days" in spec or "date_format" in spec:
+                result = self._dates(series, spec.get("add_days", 0), spec.get("date_format", "%d.%m.%Y"))
+            elif "number_format" in spec:
+                result = self._numbers(series, spec["number_format"])
+            else:
+                result = _text_series(series)
 
-    return True
+        if "fallback" in spec:
+            result = result.where(result != "", _text_series(df[col_letter_to_index(spec["fallback"])]))
+        if "default" in spec:
+            result = result.where(result != "", str(spec["default"]))
+        return result.tolist()
 
+    @staticmethod
+    def _template(df, template):
+        # "{B} - {C}" -> literal + column + literal + column ... as whole-column string additions
+        result = pd.Series("", index=df.index, dtype=object)
+        pos = 0
+        for m in _COLUMN_REF.finditer(template):
+            result = result + template[pos:m.start()] + _text_series(df[col_letter_to_index(m.group(1))])
+            pos = m.end()
+        return result + template[pos:]
 
-    # # Build cumulative mapping of runs → text offsets
-    # cumulative = []
-    # full_text = ""
-    # for i, run in enumerate(para.runs):
-    #     text = run.text or ""
-    #     start = len(full_text)
-    #     full_text += text
-    #     end = len(full_text)
-    #     cumulative.append((i, start, end))
+    @staticmethod
+    def _dates(series, add_days, date_format):
+        # text dates (day first) and Excel serials, see core.date_utils
+        series = parse_dates(series)
+        if add_days:
+            series = series + pd.Timedelta(days=add_days)
+        return series.dt.strftime(date_format).fillna("").astype(object)
 
-    # if placeholder not in full_text:
-    #     return False
+    @staticmethod
+    def _numbers(series, number_format):
+        # dates would come out as their internal nanosecond counts
+        if pd.api.types.is_datetime64_any_dtype(series) or series.map(lambda v: isinstance(v, datetime)).any():
+            raise ValueError(f"number_format {number_format!r} used on a date column; use date_format instead")
+        numbers = pd.to_numeric(series, errors="coerce")
+        if number_format.endswith(_INTEGER_TYPES):
+            # half away from zero, as people round (Series.round() goes half to even: 2.5 -> 2)
+            numbers = (np.sign(numbers) * np.floor(numbers.abs() + 0.5)).astype("Int64")
+        # each distinct value is formatted once, then mapped onto the column
+        formatted = {v: format(v, number_format) for v in numbers.dropna().unique()}
+        return numbers.map(formatted).fillna("").astype(object)
+
+
+_INTEGER_TYPES = ("d", "n", "x", "X", "o", "b", "c")
+_STRFTIME_DIRECTIVE = re.compile(r"%[-#]?.")
+
+
+def _check_number_format(number_format):
+    # format() must accept the spec for the kind of value it will get
+    if not isinstance(number_format, str):
+        raise ValueError(f"Invalid number_format {number_format!r}: must be text, e.g. \",.2f\"")
+    sample = 1 if str(number_format).endswith(_INTEGER_TYPES) else 1.0
+    try:
+        format(sample, number_format)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid number_format {number_format!r}: {e}")
+
+
+def _check_date_format(date_format):
+    # strftime() leaves unknown directives ("%Q") as they are instead of failing:
+    # every directive must be replaced, and there must be at least one date part
+    if not isinstance(date_format, str):
+        raise ValueError(f"Invalid date_format {date_format!r}: must be text, e.g. \"%d.%m.%Y\"")
+    sample = datetime(2000, 1, 1)
+    directives = _STRFTIME_DIRECTIVE.findall(date_format)
+    for directive in directives:
+        try:
+            unchanged = sample.strftime(directive) == directive
+        except ValueError:
+            unchanged = True
+        if unchanged:
+            raise ValueError(f"Invalid date_format {date_format!r}: unknown directive {directive}")
+    if not any(directive != "%%" for directive in directives):
+        raise ValueError(f"Invalid date_format {date_format!r}: no date directive (e.g. %d.%m.%Y)")
+
+
+def _text_series(series: pd.Series) -> pd.Series:
+    # format_column() as a Series aligned with the frame
+    return pd.Series(format_column(series), index=series.index, dtype=object)
+
+
+def _template_list(filename_pattern, replacements, extra_templates):
+    # [(pattern, rules)] of the main template + the other templates filled from the same rows
+    extra_templates = extra_templates or []
+    if not isinstance(extra_templates, (list, tuple)) or not all(
+            isinstance(t, (list, tuple)) and len(t) == 2 and isinstance(t[0], str) for t in extra_templates):
+        raise ValueError(f"Other templates must be a list of [filename pattern, rules]: {extra_templates!r}")
+    return [(filename_pattern, replacements), *(tuple(t) for t in extra_templates)]
+
+
+def rule_columns(replacements: list) -> dict:
+    """
+    [[find_text, col_letter or expression spec], ...] -> {find_text: column key}
+    where the key is a column index or a DerivedColumn.
+    When the same placeholder is listed twice the first rule wins.
+    """
+    if not isinstance(replacements, (list, tuple)):
+        raise ValueError(f"Rules must be a list of [find text, column letter or spec]: {replacements!r}")
+    rules = {}
+    for rule in replacements:
+        if not isinstance(rule, (list, tuple)) or len(rule) != 2 or not isinstance(rule[0], str):
+            raise ValueError(f"Rule must be [find text, column letter or spec]: {rule!r}")
+        find_txt, source = rule
+        if find_txt and find_txt not in rules:
+            rules[find_txt] = DerivedColumn(source) if isinstance(source, dict) else col_letter_to_index(source)
+    return rules
+
+
+def load_id_rows(excel_path, header_rows: int, id_col_letter: str, col_keys) -> dict:
+    """
+    Read the Excel file once and return {id: {column key: text}} for the
+    given keys (column indexes and DerivedColumns, see rule_columns).
+    Only the ID column and the columns the keys need are read (usecols) and
+    every key is formatted / evaluated for all rows in bulk.
+    """
+    id_idx = col_letter_to_index(id_col_letter)
+    col_keys = set(col_keys)
+    needed = set()
+    for key in col_keys:
+        needed.update(key.columns() if isinstance(key, DerivedColumn) else (key,))
+    usecols = sorted({id_idx, *needed})
+
+    try:
+        df = pd.read_excel(excel_path, header=None, skiprows=header_rows, usecols=usecols)
+    except pd.errors.ParserError as e:
+        # usecols points past the last column of the sheet
+        raise ValueError(f"Replace rules reference a column that is not in the Excel sheet: {e}") from e
+
+    df = df[df[id_idx].notna()]
+    ids = _normalize_ids(df[id_idx])
+    columns = {
+        key: key.evaluate(df) if isinstance(key, DerivedColumn) else format_column(df[key])
+        for key in col_keys
+    }
+
+    # later rows win on duplicate IDs, like a dict built row by row
+    return {
+        doc_id: {key: column[pos] for key, column in columns.items()}
+        for pos, doc_id in enumerate(ids)
+    }
+
+
+def load_id_values(excel_path, header_rows: int, id_col_letter: str, replacements: list) -> dict:
+    """
+    Read the Excel file once and return {id: {placeholder: replacement text}}.
+
+    The rules are resolved once (see load_id_rows for the reading), so
+    filling a document is a plain dict lookup.
+    """
+    rules = rule_columns(replacements)
+    rows = load_id_rows(excel_path, header_rows, id_col_letter, rules.values())
+    return {
+        doc_id: {find_txt: row[idx] for find_txt, idx in rules.items()}
+        for doc_id, row in rows.items()
+    }
+
+
+def _fill(template, doc_id, fname, values):
+    # apply a compiled template -> (output_bytes or None when nothing changed, log_lines, stats)
+    out_bytes, replaced, spanning = None, 0, 0
+    if template is not None:
+        out_bytes, replaced, spanning = template.apply(values)
+    if spanning:
+        logger.warning("[%s] %d spanning-run placeholder(s) rewritten across runs", doc_id, spanning)
+    stats = {"replaced": replaced, "spanning": spanning}
+
+    if out_bytes is None:
+        return None, [f"[{doc_id}] Unchanged (no placeholder found): {fname}"], stats
+    return out_bytes, [f"[{doc_id}] Updated: {fname}"], stats
+
+
+def process_document(doc_id, fname, src_bytes, values, engine=ENGINE_DOCX):
+    """
+    Fill one DOCX. `values` maps placeholder -> replacement text.
+    Runs in the calling process or in a pool worker, so it only takes and
+    returns plain data: (output_bytes or None when nothing changed, log_lines,
+    stats) where stats holds the replacement counts and the wall/CPU seconds
+    spent here (measured in the process that did the work).
+    """
+    logger.debug("→ Processing ID %s", doc_id)
+    wall, cpu = time.perf_counter(), time.process_time()
+    # placeholders are located once per unique template, then only applied
+    template = get_compiled_template(src_bytes, values, engine) if values else None
+    out_bytes, lines, stats = _fill(template, doc_id, fname, values)
+    stats["wall"] = time.perf_counter() - wall
+    stats["cpu"] = time.process_time() - cpu
+    return out_bytes, lines, stats
 
-    # # Create the new full text with replacements
-    # new_full = full_text.replace(placeholder, replacement)
 
-    # # Clear all runs
-    # for run in para.runs:
-    #     run.text = ""
+def _fill_timed(template, doc_id, fname, values):
+    # _fill() + the wall/CPU seconds it took, as process_document() reports them
+    wall, cpu = time.perf_counter(), time.process_time()
+    out_bytes, lines, stats = _fill(template, doc_id, fname, values)
+    stats["wall"] = time.perf_counter() - wall
+    stats["cpu"] = time.process_time() - cpu
+    return out_bytes, lines, stats
 
-    # # Redistribute new_full across runs by original lengths
-    # pos = 0
-    # for i, start, end in cumulative:
-    #     length = end - start
-    #     slice_text = new_full[pos : pos + length]
-    #     para.runs[i].text = slice_text
-    #     pos += length
 
-    # # Append any leftover text to the last run
-    # if pos < len(new_full):
-    #     para.runs[-1].text += new_full[pos:]
+# One document to fill. A plain namedtuple so it pickles to pool workers.
+DocTask = namedtuple("DocTask", "doc_id fname src_bytes values engine")
 
-    # return True
+# All documents of one ID (one per template), filled in the same worker pass.
+IdTask = namedtuple("IdTask", "doc_id docs")
+
+# One row of iter_generate(): the template is not part of the task, each pool
+# worker compiles it once when it starts (_init_template_worker), so a batch
+# of N rows does not pickle the template N times.
+RowTask = namedtuple("RowTask", "doc_id fname values")
+TASK_TYPES = (DocTask, IdTask, RowTask)
+
+# the compiled template of the iter_generate() job a pool worker was started for
+_worker_template = None
+
+
+def _init_template_worker(template_bytes, find_texts, engine):
+    # ProcessPoolExecutor initializer: runs once per worker process
+    global _worker_template
+    _worker_template = get_compiled_template(template_bytes, find_texts, engine) if find_texts else None
+
+# Output taken over unchanged from the previous job (incremental mode).
+Reused = namedtuple("Reused", "doc_id fname")
+
+
+# True inside the pool workers started by _run_tasks()
+_in_pool_worker = False
+
+
+def _init_pool_worker(initializer, initargs):
+    global _in_pool_worker
+    _in_pool_worker = True
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _process_task(task):
+    # ProcessPoolExecutor hands over a single argument
+    if isinstance(task, IdTask):
+        results = [process_document(*doc) for doc in task.docs]
+    elif isinstance(task, RowTask):
+        results = [_fill_timed(_worker_template, *task)]
+    else:
+        results = [process_document(*task)]
+    if _in_pool_worker:
+        # the pool lives for one job only, so the worker's own high-water mark is this job's
+        worker_rss = _max_rss_kb()
+        for _, _, stats in results:
+            stats["worker_rss_kb"] = worker_rss
+    return results if isinstance(task, IdTask) else results[0]
+
+
+def document_fingerprint(template_hash: str, replacements: list, values: dict, engine: str) -> str:
+    """
+    Fingerprint of everything one output document is built from: the
+    template's content hash, the rule set and the row values the rules
+    actually reference. Same fingerprint -> same document.
+    """
+    payload = json.dumps(
+        [template_hash, [list(rule) for rule in replacements], sorted(values.items()), engine],
+        ensure_ascii=False, default=str, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 def col_letter_to_index(letter: str) -> int:
     """
     Convert Excel column letters (A, B, …, Z, AA, AB, …) to zero-based index.
     """
+    if not isinstance(letter, str) or not letter.strip():
+        raise ValueError(f"Invalid column letter: {letter!r}")
     letter = letter.strip().upper()
     idx = 0
     for ch in letter:
@@ -108,167 +800,706 @@ def col_letter_to_index(letter: str) -> int:
             raise ValueError(f"Invalid column letter: {letter}")
     return idx - 1
 
-def batch_find_replace(
-    excel_path: str,
+def pattern_fields(filename_pattern: str) -> list:
+    """
+    str.format() pieces of a filename pattern: [(literal text, format spec or
+    None)], the spec belonging to the {id} field after the literal ({id} ->
+    "", {id:03d} -> "03d"; None after the trailing literal).
+    Raises ValueError for a malformed pattern, for fields other than {id} and
+    when there is no {id} at all.
+    """
+    pieces = []
+    try:
+        parsed = list(string.Formatter().parse(filename_pattern))
+    except ValueError as e:
+        raise ValueError(f"Invalid filename pattern {filename_pattern!r}: {e}")
+    for literal, field, spec, conversion in parsed:
+        if field is not None and field != "id":
+            raise ValueError(f"Filename pattern can only use {{id}}, not {{{field}}}: {filename_pattern}")
+        pieces.append((literal, None if field is None else spec))
+    if not any(spec is not None for _, spec in pieces):
+        raise ValueError(f"Filename pattern has no {{id}} placeholder: {filename_pattern}")
+    return pieces
+
+
+def format_filename(filename_pattern: str, doc_id) -> str:
+    """
+    filename_pattern.format(id=doc_id), where an ID the format spec does not
+    fit ("A12" with {id:03d}) is written as it is instead of failing.
+    """
+    try:
+        return filename_pattern.format(id=doc_id)
+    except (ValueError, TypeError):
+        return "".join(literal + ("" if spec is None else str(doc_id))
+                       for literal, spec in pattern_fields(filename_pattern))
+
+
+def filename_regex(filename_pattern: str):
+    """
+    Turn a filename pattern with {id} (format specs like {id:03d} included)
+    into a regex that pulls the ID out of an archive member name. It tolerates
+    what zip tools and Windows do to names: a folder prefix inside the archive,
+    other letter case, a different amount of whitespace and zero-padded
+    numbers ('TS007' -> 7).
+    """
+    pieces = pattern_fields(filename_pattern)
+
+    def literal(text):
+        # any run of whitespace matches any run of whitespace
+        return "".join(r"\s+" if piece.isspace() else re.escape(piece)
+                       for piece in re.split(r"(\s+)", text) if piece)
+
+    body, seen_id = "", False
+    for text, spec in pieces:
+        body += literal(text)
+        if spec is not None:
+            # a spec may pad the ID with spaces ("{id:>5}")
+            body += r"\s*" if spec else ""
+            body += r"(?P=id)" if seen_id else r"(?P<id>\d+|[^/]+?)"
+            seen_id = True
+    return re.compile(r"(?:.*/)?" + body + "$", re.IGNORECASE)
+
+
+def index_archive(names, filename_pattern: str) -> dict:
+    """
+    Read the archive's name list once -> {id: member name} for every name that
+    matches filename_pattern (see filename_regex). Digit-only IDs become int,
+    like the IDs from Excel. When two members give the same ID ('TS7' and
+    'TS007'), the one spelled exactly like the pattern wins, otherwise the first.
+    """
+    regex = filename_regex(filename_pattern)
+    index = {}
+    for name in names:
+        m = regex.match(name)
+        if not m:
+            continue
+        raw = m.group("id")
+        doc_id = int(raw) if raw.isdigit() else raw
+        if doc_id in index:
+            logger.warning("Members %r and %r both have ID %s", index[doc_id], name, doc_id)
+            if name != format_filename(filename_pattern, doc_id):
+                continue
+        index[doc_id] = name
+    return index
+
+
+def _id_sort_key(doc_id):
+    # numbers in numeric order first, then any text IDs
+    if isinstance(doc_id, (int, float)):
+        return (0, doc_id, "")
+    return (1, 0, str(doc_id))
+
+
+def _in_range(doc_id, start_id=None, end_id=None):
+    if start_id is None and end_id is None:
+        return True
+    if not isinstance(doc_id, (int, float)):
+        return False
+    return (start_id is None or doc_id >= start_id) and (end_id is None or doc_id <= end_id)
+
+
+def match_ids(archive_index: dict, id_to_values: dict, start_id=None, end_id=None):
+    """
+    Join the archive index with the Excel index (both dicts, so O(1) per ID),
+    optionally limited to [start_id..end_id]. Returns sorted lists
+    (both, archive_only, excel_only): the IDs to process and the orphans on
+    each side.
+    """
+    archive_ids = {i for i in archive_index if _in_range(i, start_id, end_id)}
+    excel_ids = {i for i in id_to_values if _in_range(i, start_id, end_id)}
+    return (sorted(archive_ids & excel_ids, key=_id_sort_key),
+            sorted(archive_ids - excel_ids, key=_id_sort_key),
+            sorted(excel_ids - archive_ids, key=_id_sort_key))
+
+
+def _worker_count(workers):
+    # 0/None = one per CPU; never more processes than CPUs (callers other than
+    # the forms are not bounded, and each worker holds a whole document)
+    cpus = os.cpu_count() or 1
+    if not workers:
+        return cpus
+    return max(1, min(workers, cpus))
+
+
+def _run_tasks(items, workers, initializer=None, initargs=()):
+    """
+    Yield (item, result) in input order. Tasks (TASK_TYPES) are processed here
+    or in a process pool with at most 2 * workers tasks in flight, so memory
+    stays bounded however long the batch is; anything else (log lines of
+    skipped IDs, reused outputs) passes straight through with result None.
+    `initializer(*initargs)` runs once in each pool worker (and once here
+    when there is no pool).
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield item, (_process_task(item) if isinstance(item, TASK_TYPES) else None)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker,
+                             initargs=(initializer, initargs)) as pool:
+        pending = deque()
+        for item in items:
+            work = isinstance(item, TASK_TYPES)
+            pending.append((item, pool.submit(_process_task, item) if work else None))
+            while len(pending) > 2 * workers:
+                done, fut = pending.popleft()
+                yield done, (fut.result() if fut is not None else None)
+        while pending:
+            done, fut = pending.popleft()
+            yield done, (fut.result() if fut is not None else None)
+
+
+# Name of the telemetry manifest added as the last member of the output ZIP.
+REPORT_NAME = "job_report.json"
+
+
+def _input_size(source):
+    # bytes / path / Django upload / BytesIO -> size in bytes (None when unknown)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if isinstance(getattr(source, "size", None), int):
+        return source.size
+    if isinstance(source, BytesIO):
+        return source.getbuffer().nbytes
+    return None
+
+
+def _max_rss_kb():
+    # high-water mark of this process since it started
+    if resource is None:
+        return None
+    scale = 1024 if sys.platform == "darwin" else 1  # macOS reports bytes, Linux KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+
+
+def _current_rss_kb():
+    # resident set right now (Linux /proc; None elsewhere)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class JobReport:
+    """
+    Telemetry of one job: wall and CPU seconds per stage, one entry per
+    document (timings, replacement counts, sizes), input sizes and memory.
+    as_dict() is plain JSON data - stored with the ReplaceJob and written into
+    the output ZIP as REPORT_NAME.
+
+    Memory is measured per job, not as the server's lifetime high-water mark:
+    - rss_start_kb / rss_growth_kb: resident set of this process when the job
+      started, and how far it grew above that, sampled after every stage and
+      document (a peak inside one document can be missed; Linux only)
+    - pool_worker_max_rss_kb: largest high-water mark of a pool worker, which
+      is started for this job (None without a pool)
+
+    Stages:
+    - excel:    load_id_values()
+    - open_zip: opening the uploaded archive
+    - read:     decompressing each member + fingerprinting it
+    - fill:     compile + apply per document, as measured by the process that
+                did it (with a pool this is summed worker time)
+    - write:    time the consumer of the generator took per entry
+                (ZIP compression + sending the chunk to the client)
+    """
+
+    def __init__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self.stages = {}
+        self.documents = []
+        self.skipped = 0
+        self.orphans = {}
+        self.input_bytes = {}
+        self._rss_start = self._rss_max = _current_rss_kb()
+        self._worker_rss = None
+
+    def _sample_memory(self, stats=None):
+        rss = _current_rss_kb()
+        if rss is not None and self._rss_max is not None:
+            self._rss_max = max(self._rss_max, rss)
+        worker_rss = (stats or {}).get("worker_rss_kb")
+        if worker_rss is not None:
+            self._worker_rss = max(self._worker_rss or 0, worker_rss)
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_stage(self, name, wall, cpu):
+        totals = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+        totals["wall"] += wall
+        totals["cpu"] += cpu
+        self._sample_memory()
+
+    def add_document(self, doc_id, fname, status, input_bytes, output_bytes, stats=None):
+        entry = {"id": doc_id, "file": fname, "status": status,
+                 "input_bytes": input_bytes, "output_bytes": output_bytes}
+        if stats:
+            self.add_stage("fill", stats["wall"], stats["cpu"])
+            entry.update(replaced=stats["replaced"], spanning=stats["spanning"],
+                         wall=round(stats["wall"], 6), cpu=round(stats["cpu"], 6))
+        self._sample_memory(stats)
+        self.documents.append(entry)
+        return entry
+
+    def as_dict(self) -> dict:
+        statuses = {}
+        for doc in self.documents:
+            statuses[doc["status"]] = statuses.get(doc["status"], 0) + 1
+        return {
+            "wall": round(time.perf_counter() - self._wall, 6),
+            "cpu": round(time.process_time() - self._cpu, 6),
+            "stages": {name: {k: round(v, 6) for k, v in t.items()} for name, t in self.stages.items()},
+            "documents": statuses,
+            "skipped": self.skipped,
+            "orphans": self.orphans,
+            "spanning": sum(doc.get("spanning", 0) for doc in self.documents),
+            "input_bytes": self.input_bytes,
+            "output_bytes": sum(doc["output_bytes"] for doc in self.documents),
+            "memory": {
+                "rss_start_kb": self._rss_start,
+                "rss_growth_kb": None if self._rss_start is None else self._rss_max - self._rss_start,
+                "pool_worker_max_rss_kb": self._worker_rss,
+            },
+            "per_document": self.documents,
+        }
+
+    def manifest(self) -> bytes:
+        return json.dumps(self.as_dict(), indent=2).encode("utf-8")
+
+
+def _with_report(entries, report):
+    # time what the consumer does with each entry, then close the ZIP with the manifest
+    for arcname, data in entries:
+        wall, cpu = time.perf_counter(), time.process_time()
+        yield arcname, data
+        report.add_stage("write", time.perf_counter() - wall, time.process_time() - cpu)
+    yield REPORT_NAME, report.manifest()
+
+
+def iter_find_replace(
+    excel_path,             # path or file-like object of the .xlsx
     header_rows: int,
     id_col_letter: str,
     filename_pattern: str,
-    start_id: int,
+    start_id: int,          # optional bounds on the IDs processed (None = no bound)
     end_id: int,
     replacements: list,     # list of [find_text, col_letter]
-    docx_zip_bytes: bytes   # bytes of the uploaded ZIP
+    docx_zip,               # the uploaded ZIP: path, Django upload, file-like or bytes
+    workers: int = 1,       # >1 fans documents out to a process pool; 0/None = one per CPU
+    engine: str = ENGINE_DOCX,  # "docx" (python-docx) or "xml" (raw XML, media copied as-is)
+    logs: list = None,      # log lines are appended here as documents finish
+    fingerprints: dict = None,           # filled with {output filename: fingerprint}
+    previous_fingerprints: dict = None,  # incremental mode: fingerprints of an earlier job ...
+    previous_zip=None,                   # ... and that job's output ZIP (path or file-like)
+    report: JobReport = None,            # filled with telemetry; its manifest closes the ZIP
+    extra_templates: list = None         # more [filename_pattern, replacements] pairs per ID
 ):
     """
-    1) Reads Excel file from excel_path (skipping header_rows).
-    2) Builds a map of ID -> row data using id_col_letter.
-    3) Unzips the incoming DOCX ZIP (docx_zip_bytes) into a temp folder.
-    4) For each doc_id in [start_id..end_id]:
-         - Opens the matching DOCX (filename_pattern.format(id=doc_id))
-         - Finds/replaces each placeholder, with debug logging
-         - Saves modified docs into an output temp folder
-    5) Zips up the output folder and returns (zip_bytes, logs_list).
+    1) Reads Excel file from excel_path (skipping header_rows) once, only the
+       ID column and the columns the rules of all templates use.
+    2) Builds a map of ID -> {column: text} using id_col_letter.
+    3) Opens the incoming DOCX ZIP (docx_zip) where it lies - memory-mapped
+       when it is on disk, nothing is extracted or copied into memory; members
+       are read one by one as they are needed - and indexes its name list once per
+       template by the ID that the template's pattern extracts (index_archive).
+       The templates are (filename_pattern, replacements) followed by
+       extra_templates; each member belongs to the first pattern it matches.
+    4) Returns a generator that, for each ID found both in the archive and
+       in Excel (limited to [start_id..end_id] when given), in ID order:
+         - Reads the matching member of every template
+         - Finds/replaces all placeholders in one pass per paragraph
+           (body, tables, headers and footers) with that template's rules
+         - Yields (arcname, bytes) for the output ZIP as soon as it is done;
+           documents without placeholders are yielded as RawMember so they
+           are copied into the output without recompression
+       With workers > 1 the documents are filled by a process pool, all
+       documents of one ID in the same task; results still come out in ID
+       order, so the ZIP and the logs are the same as in the sequential run.
+       In incremental mode (previous_fingerprints + previous_zip) a document
+       whose fingerprint is unchanged is not regenerated: its output is
+       copied, still compressed, from the previous job's ZIP.
+       IDs found on only one side are logged ("File not found" / "No Excel
+       data") and listed per template as orphans in the report.
+       With a `report`, every stage and document is timed into it and the
+       report is added as the last entry (REPORT_NAME).
+    Steps 1-3 run immediately, so bad input raises before anything is streamed.
+    Feed the generator to core.zip_utils.stream_zip().
     """
     # check if def batch_find_replace(...) is running at all
     logger.debug("▶︎ Entered batch_find_replace() with %d rules", len(replacements))
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    workers = _worker_count(workers)
+    if logs is None:
+        logs = []
+    if fingerprints is None:
+        fingerprints = {}
+    manifest = report is not None
+    if report is None:
+        report = JobReport()
+    report.input_bytes = {"excel": _input_size(excel_path), "docx_zip": _input_size(docx_zip)}
+    templates = _template_list(filename_pattern, replacements, extra_templates)
+    template_rules = [rule_columns(rules) for _, rules in templates]
 
 
-    # ---- 1) Read Excel & map IDs to rows ----
-    df = pd.read_excel(excel_path, header=None, skiprows=header_rows)
-    id_idx = col_letter_to_index(id_col_letter)
-    id_to_row = {}
-    for _, row in df.iterrows():
-        raw = row[id_idx]
-        if pd.isna(raw):
-            continue
-        key = int(raw) if isinstance(raw, (int, float)) and float(raw).is_integer() else raw
-        id_to_row[key] = row
+    # ---- 1) Read Excel once for all templates: ID -> {column: ready-made text} ----
+    with report.stage("excel"):
+        id_to_row = load_id_rows(excel_path, header_rows, id_col_letter,
+                                 {key for rules in template_rules for key in rules.values()})
 
-    # ---- 2) Unzip DOCX files into temp_in ----
-    tmp_in = tempfile.mkdtemp(prefix="docx_in_")
-    tmp_out = tempfile.mkdtemp(prefix="docx_out_")
-    with zipfile.ZipFile(BytesIO(docx_zip_bytes)) as zin:
-        zin.extractall(tmp_in)
-    # test to see which files are being extracted
-    files = os.listdir(tmp_in)
-    logger.debug("▶︎ Extracted DOCX files: %r", files)
+    # ---- 2) Open the DOCX ZIP in place (no extraction, no copy), index it per template ----
+    with report.stage("open_zip"):
+        zin = open_zip(docx_zip)
+        members = {info.filename: info for info in zin.infolist() if not info.is_dir()}
+        indexes = []
+        claimed = set()
+        for pattern, _ in templates:
+            index = index_archive((n for n in members if n not in claimed), pattern)
+            claimed.update(index.values())
+            indexes.append(index)
+    logger.debug("▶︎ DOCX files in archive: %r", list(members))
 
+    # per template: (IDs to fill, files without Excel row, Excel rows without file)
+    plans = [match_ids(index, id_to_row, start_id, end_id) for index in indexes]
+    report.orphans = {
+        pattern: {"archive_only": archive_only, "excel_only": excel_only}
+        for (pattern, _), (_, archive_only, excel_only) in zip(templates, plans)
+    }
 
-    logs = []
+    previous = None
+    if previous_fingerprints and previous_zip is not None:
+        previous = open_zip(previous_zip)
+        previous_members = {info.filename: info for info in previous.infolist()}
 
-    # ---- 3) Process each ID ----
-    for doc_id in range(start_id, end_id + 1):
-        # check if files are being processed
-        logger.debug("→ Processing ID %s", doc_id)
-        fname = filename_pattern.format(id=doc_id)
-        src_path = os.path.join(tmp_in, fname)
+    # ---- 3) Work per ID, produced lazily ----
+    # orphans are plain log lines and reused outputs are Reused, both keep
+    # their place in the ID order; the documents to fill go out as one IdTask
+    missing_files = [set(excel_only) for _, _, excel_only in plans]
+    missing_rows = [set(archive_only) for _, archive_only, _ in plans]
+    all_ids = {doc_id for plan in plans for ids in plan for doc_id in ids}
 
-        if not os.path.isfile(src_path):
-            logs.append(f"[{doc_id}] File not found: {fname}")
-            continue
-        if doc_id not in id_to_row:
-            logs.append(f"[{doc_id}] No Excel data; skipping {fname}")
-            continue
+    def iter_tasks():
+        for doc_id in sorted(all_ids, key=_id_sort_key):
+            docs = []
+            for t, (pattern, rules) in enumerate(templates):
+                if doc_id in missing_files[t]:
+                    yield f"[{doc_id}] File not found: {format_filename(pattern, doc_id)}"
+                    continue
+                fname = indexes[t].get(doc_id)
+                if fname is None:
+                    continue  # ID not in this template's range / archive
+                if doc_id in missing_rows[t]:
+                    yield f"[{doc_id}] No Excel data; skipping {fname}"
+                    continue
+                row = id_to_row[doc_id]
+                values = {find_txt: row[idx] for find_txt, idx in template_rules[t].items()}
 
-        doc = Document(src_path)
-        row = id_to_row[doc_id]
-        changed = False
+                with report.stage("read"):
+                    src_bytes = zin.read(members[fname])
+                    fp = document_fingerprint(hashlib.sha256(src_bytes).hexdigest(), rules, values, engine)
+                fingerprints[fname] = fp
+                if previous is not None and previous_fingerprints.get(fname) == fp and fname in previous_members:
+                    yield Reused(doc_id, fname)
+                    continue
 
-        # ---- 4) Apply each find/replace rule ----
-        for find_txt, col_let in replacements:
-            col_idx = col_letter_to_index(col_let)
-            raw_val = row[col_idx]
+                docs.append(DocTask(doc_id, fname, src_bytes, values, engine))
+            if docs:
+                yield IdTask(doc_id, tuple(docs))
 
-            if isinstance(raw_val, (Timestamp, datetime)):
-                repl = raw_val.strftime("%d.%m.%Y")
-            elif pd.isna(raw_val):
-                repl = ""
-            else:
-                repl = str(raw_val)
-
-            # --- Paragraphs ---
-            for para in doc.paragraphs:
-                if find_txt in para.text:
-                    #print(f"[DEBUG] Found '{find_txt}' in paragraph: '{para.text[:40]}…'")
-                    logger.debug("Found %r in paragraph: %.40r…", find_txt, para.text)
-                    # Try run-by-run replace
-                    replaced_in_run = False
-                    for ri, run in enumerate(para.runs):
-                        if find_txt in run.text:
-                            #print(f"[DEBUG] ‑- Replacing in run {ri}: '{run.text}'")
-                            logger.debug("Found %r in paragraph: %.40r…", find_txt, para.text)
-                            run.text = run.text.replace(find_txt, repl)
-                            changed = True
-                            replaced_in_run = True
-
-                    # Fallback: coalesce paragraph
-                    # if not replaced_in_run:
-                        #print(f"[WARN] Placeholder spans runs — coalescing paragraph.")
-                        #logger.warning("Placeholder spans runs — coalescing paragraph.")
-                        # full = para.text.replace(find_txt, repl)
-                        # for run in para.runs:
-                        #     run.text = ""
-                        # para.runs[0].text = full
-                        # changed = True
-                    # Fallback: preserve formatting across runs
-                    if not replaced_in_run:
-                        logger.warning("Spanning-run placeholder; invoking style-preserving replacer")
-                        if replace_placeholder_preserve_runs(para, find_txt, repl):
-                            changed = True
-
-
-            # --- Tables ---
-            for table in doc.tables:
-                for row_cells in table.rows:
-                    for cell in row_cells.cells:
-                        for para in cell.paragraphs:
-                            if find_txt in para.text:
-                                #print(f"[DEBUG] Found '{find_txt}' in table cell: '{para.text[:40]}…'")
-                                logger.debug("Found %r in paragraph: %.40r…", find_txt, para.text)
-                                replaced_in_run = False
-                                for ri, run in enumerate(para.runs):
-                                    if find_txt in run.text:
-                                        #print(f"[DEBUG] ‑- Replacing in run {ri}: '{run.text}'")
-                                        logger.debug("Found %r in paragraph: %.40r…", find_txt, para.text)
-                                        run.text = run.text.replace(find_txt, repl)
-                                        changed = True
-                                        replaced_in_run = True
-                                # if not replaced_in_run:
-                                #     #print(f"[WARN] Table placeholder spans runs — coalescing paragraph.")
-                                #     logger.warning("Placeholder spans runs — coalescing paragraph.")
-                                #     full = para.text.replace(find_txt, repl)
-                                #     for run in para.runs:
-                                #         run.text = ""
-                                #     para.runs[0].text = full
-                                #     changed = True
-                                # Fallback: preserve formatting across runs
-                                if not replaced_in_run:
-                                    logger.warning("Spanning-run placeholder; invoking style-preserving replacer")
-                                    if replace_placeholder_preserve_runs(para, find_txt, repl):
-                                        changed = True
-
-
-        # ---- 5) Save to output folder ----
-        dst_path = os.path.join(tmp_out, fname)
-        if changed:
-            doc.save(dst_path)
-            logs.append(f"[{doc_id}] Updated: {fname}")
+    # ---- 4) Find/replace and hand each result on, in ID order ----
+    def generate():
+        try:
+            for item, result in _run_tasks(iter_tasks(), workers):
+                if isinstance(item, str):
+                    logs.append(item)
+                    report.skipped += 1
+                    continue
+                if isinstance(item, Reused):
+                    fname = item.fname
+                    logs.append(f"[{item.doc_id}] Reused from previous job: {fname}")
+                    report.add_document(item.doc_id, fname, "reused",
+                                        members[fname].file_size, previous_members[fname].file_size)
+                    yield fname, RawMember(previous, previous_members[fname])
+                    continue
+                for doc, (out_bytes, lines, stats) in zip(item.docs, result):
+                    fname = doc.fname
+                    src_size = members[fname].file_size
+                    logs.extend(lines)
+                    report.add_document(doc.doc_id, fname, "updated" if out_bytes is not None else "unchanged",
+                                        src_size, len(out_bytes) if out_bytes is not None else src_size, stats)
+                    if out_bytes is not None:
+                        yield fname, out_bytes
+                    else:
+                        # No changes: pass the original member through, still compressed
+                        yield fname, RawMember(zin, members[fname])
+        finally:
+            zin.close()
+            if previous is not None:
+                previous.close()
+
+    return _with_report(generate(), report) if manifest else generate()
+
+
+def iter_generate(
+    template_bytes: bytes,  # the single template DOCX
+    excel_path,             # path or file-like object of the .xlsx
+    header_rows: int,
+    id_col_letter: str,
+    output_pattern: str,    # output filename with {id}, e.g. "6 Proces Verbal TS{id}.docx"
+    start_id: int,          # optional bounds on the IDs generated (None = no bound)
+    end_id: int,
+    replacements: list,     # list of [find_text, col_letter]
+    workers: int = 1,
+    engine: str = ENGINE_DOCX,
+    logs: list = None,
+    report: JobReport = None  # filled with telemetry; its manifest closes the ZIP
+):
+    """
+    Bulk generation straight from Excel rows - no cloning round-trip:
+    1) Reads the Excel file once (ID -> {placeholder: text}).
+    2) Compiles the template once (placeholder locations, see CompiledTemplate).
+    3) Returns a generator yielding (format_filename(output_pattern, id), bytes)
+       for every ID of the Excel index (limited to [start_id..end_id] when
+       given), in ID order - gaps in the range cost nothing.
+    Steps 1-2 run immediately, so bad input raises before anything is streamed.
+    """
+    logger.debug("▶︎ Entered iter_generate() with %d rules", len(replacements))
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    workers = _worker_count(workers)
+    if logs is None:
+        logs = []
+
+    manifest = report is not None
+    if report is None:
+        report = JobReport()
+    report.input_bytes = {"excel": _input_size(excel_path), "template": len(template_bytes)}
+
+    # ---- 1) Read Excel once ----
+    with report.stage("excel"):
+        id_to_values = load_id_values(excel_path, header_rows, id_col_letter, replacements)
+
+    # ---- 2) Compile the template once ----
+    # (pool workers compile their own copy when they start, see _init_template_worker)
+    find_texts = [find_txt for find_txt, _ in replacements if find_txt]
+    with report.stage("compile"):
+        template = get_compiled_template(template_bytes, dict.fromkeys(find_texts), engine) if find_texts else None
+
+    def iter_tasks():
+        ids = sorted((i for i in id_to_values if _in_range(i, start_id, end_id)), key=_id_sort_key)
+        for doc_id in ids:
+            yield RowTask(doc_id, format_filename(output_pattern, doc_id), id_to_values[doc_id])
+
+    # ---- 3) Fill one document per row ----
+    def generate():
+        if workers > 1:
+            # the template goes to each worker once, with the pool initializer
+            results = _run_tasks(iter_tasks(), workers, _init_template_worker,
+                                 (template_bytes, tuple(dict.fromkeys(find_texts)), engine))
         else:
-            # No changes: copy original
-            from shutil import copyfile
-            copyfile(src_path, dst_path)
-            logs.append(f"[{doc_id}] Unchanged (no placeholder found): {fname}")
-
-    # ---- 6) Zip up modified docs ----
-    out_zip = BytesIO()
-    with zipfile.ZipFile(out_zip, "w", zipfile.ZIP_DEFLATED) as zout:
-        for root, _, files in os.walk(tmp_out):
-            for f in files:
-                full = os.path.join(root, f)
-                arc = os.path.relpath(full, tmp_out)
-                zout.write(full, arc)
-    out_zip.seek(0)
-
-    return out_zip.getvalue(), logs
+            # in-process: apply the compiled template directly
+            results = ((item, _fill_timed(template, *item)) for item in iter_tasks())
+        for item, result in results:
+            if isinstance(item, str):
+                logs.append(item)
+                report.skipped += 1
+                continue
+            out_bytes, lines, stats = result
+            logs.extend(lines)
+            status = "updated" if out_bytes is not None else "unchanged"
+            if out_bytes is None:
+                out_bytes = template_bytes
+            report.add_document(item.doc_id, item.fname, status, len(template_bytes), len(out_bytes), stats)
+            yield item.fname, out_bytes
+
+    return _with_report(generate(), report) if manifest else generate()
+
+
+def batch_find_replace(
+    excel_path,             # path or file-like object of the .xlsx
+    header_rows: int,
+    id_col_letter: str,
+    filename_pattern: str,
+    start_id: int,
+    end_id: int,
+    replacements: list,     # list of [find_text, col_letter]
+    docx_zip,               # the uploaded ZIP: path, Django upload, file-like or bytes
+    workers: int = 1,       # >1 fans documents out to a process pool; 0/None = one per CPU
+    engine: str = ENGINE_DOCX,  # "docx" (python-docx) or "xml" (raw XML, media copied as-is)
+    extra_templates: list = None  # more [filename_pattern, replacements] pairs per ID
+):
+    """
+    Same as iter_find_replace(), but collects everything into one ZIP in
+    memory and returns (zip_bytes, logs_list).
+    """
+    logs = []
+    entries = iter_find_replace(
+        excel_path, header_rows, id_col_letter, filename_pattern, start_id, end_id,
+        replacements, docx_zip, workers=workers, engine=engine, logs=logs,
+        extra_templates=extra_templates
+    )
+    return b"".join(stream_zip(entries)), logs
+
+
+# ---- Dry run: where would the rules match, without filling anything ----
+
+_W_P, _W_R, _W_T, _W_TAB, _W_BR, _W_CR = (qn(t) for t in ("w:p", "w:r", "w:t", "w:tab", "w:br", "w:cr"))
+_W_TBL, _W_TR, _W_TC, _W_BODY = (qn(t) for t in ("w:tbl", "w:tr", "w:tc", "w:body"))
+
+
+def _scan_paragraphs(container):
+    # same walk as iter_paragraphs(), on plain lxml elements: own paragraphs,
+    # then table cells (nested tables included). Text boxes are not visited,
+    # just like in a real run.
+    yield from container.iterchildren(_W_P)
+    for tbl in container.iterchildren(_W_TBL):
+        for tr in tbl.iterchildren(_W_TR):
+            for tc in tr.iterchildren(_W_TC):
+                yield from _scan_paragraphs(tc)
+
+
+def _scan_run_text(run):
+    # what python-docx's run.text returns for the common run children
+    parts = []
+    for child in run:
+        if child.tag == _W_T:
+            parts.append(child.text or "")
+        elif child.tag == _W_TAB:
+            parts.append("\t")
+        elif child.tag in (_W_BR, _W_CR):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def scan_docx(src_bytes, pattern) -> dict:
+    """
+    Count where `pattern` matches in one DOCX, reading only the body,
+    header and footer XML with plain lxml (no python-docx, nothing written).
+    Returns {placeholder: [matches, matches spanning several runs]}.
+    """
+    found = {}
+    with zipfile.ZipFile(BytesIO(src_bytes)) as zin:
+        for name, content_type in _text_part_names(zin).items():
+            root = etree.fromstring(zin.read(name))
+            container = root.find(_W_BODY) if content_type == CT.WML_DOCUMENT_MAIN else root
+            if container is None:
+                continue
+            for para in _scan_paragraphs(container):
+                lengths = []
+                texts = []
+                for run in para.iterchildren(_W_R):
+                    text = _scan_run_text(run)
+                    texts.append(text)
+                    lengths.append(len(text))
+                full_text = "".join(texts)
+                if not full_text:
+                    continue
+                for start, end, key in find_matches(full_text, pattern):
+                    counts = found.setdefault(key, [0, 0])
+                    counts[0] += 1
+                    # spanning = the match does not fit inside the run it starts in
+                    offset = 0
+                    for length in lengths:
+                        if start < offset + length:
+                            if end > offset + length:
+                                counts[1] += 1
+                            break
+                        offset += length
+    return found
+
+
+def scan_find_replace(
+    excel_path,             # path or file-like object of the .xlsx
+    header_rows: int,
+    id_col_letter: str,
+    filename_pattern: str,
+    start_id: int,
+    end_id: int,
+    replacements: list,     # list of [find_text, col_letter]
+    docx_zip,               # the uploaded ZIP: path, Django upload, file-like or bytes
+    extra_templates: list = None  # more [filename_pattern, replacements] pairs per ID
+) -> dict:
+    """
+    Dry run of batch_find_replace(): same inputs, no output documents.
+    1) Reads the Excel file the same way a real run does.
+    2) For every ID found in the archive or in Excel (limited to
+       [start_id..end_id] when given) and every template reports the file name and
+       status ("ok", "no match", "file not found", "no Excel data"), which
+       rules matched, which of them span several runs, and which never matched.
+    3) Files are scanned with scan_docx(); identical members (cloned from one
+       template) are scanned only once.
+    Returns {"ids": [per-ID dicts], "summary": {...}}.
+    """
+    logger.debug("▶︎ Entered scan_find_replace() with %d rules", len(replacements))
+    templates = _template_list(filename_pattern, replacements, extra_templates)
+    template_rules = [rule_columns(rules) for _, rules in templates]
+    id_to_row = load_id_rows(excel_path, header_rows, id_col_letter,
+                             {key for rules in template_rules for key in rules.values()})
+
+    # Clones of one template share CRC and size, so the central directory
+    # alone tells which members need a scan of their own.
+    scanned = {}
+    rows = []
+    summary = {"ids": 0, "ok": 0, "no_match": 0, "file_not_found": 0, "no_excel_data": 0,
+               "documents_scanned": 0, "never_matched": []}
+    ever_matched = set()
+
+    with open_zip(docx_zip) as zin:
+        members = {info.filename: info for info in zin.infolist() if not info.is_dir()}
+        claimed = set()
+        per_template = []
+        for (pattern_text, _), rules in zip(templates, template_rules):
+            index = index_archive((n for n in members if n not in claimed), pattern_text)
+            claimed.update(index.values())
+            ids = {i for plan in match_ids(index, id_to_row, start_id, end_id) for i in plan}
+            find_texts = list(rules)
+            per_template.append((pattern_text, index, ids, find_texts, compile_rules(find_texts)))
+        all_ids = sorted({i for _, _, ids, _, _ in per_template for i in ids}, key=_id_sort_key)
+        summary["ids"] = len(all_ids)
+
+        for doc_id in all_ids:
+            for pattern_text, index, ids, find_texts, pattern in per_template:
+                if doc_id not in ids:
+                    continue
+                fname = index.get(doc_id) or format_filename(pattern_text, doc_id)
+                row = {"id": doc_id, "file": fname, "matched": [], "spanning": [], "unmatched": []}
+                rows.append(row)
+
+                info = members.get(fname) if doc_id in index else None
+                row["file_found"] = info is not None
+                row["in_excel"] = doc_id in id_to_row
+                if info is None:
+                    row["status"] = "file not found"
+                elif doc_id not in id_to_row:
+                    row["status"] = "no Excel data"
+                else:
+                    key = (info.CRC, info.file_size, pattern_text)
+                    if key not in scanned:
+                        scanned[key] = scan_docx(zin.read(info), pattern) if pattern is not None else {}
+                    found = scanned[key]
+                    row["matched"] = [t for t in find_texts if t in found]
+                    row["spanning"] = [t for t in find_texts if t in found and found[t][1]]
+                    row["unmatched"] = [t for t in find_texts if t not in found]
+                    row["status"] = "ok" if found else "no match"
+                    ever_matched.update((pattern_text, t) for t in found)
+                summary[row["status"].replace(" ", "_").lower()] += 1
+
+    summary["documents_scanned"] = len(scanned)
+    summary["never_matched"] = [t for pattern_text, _, _, find_texts, _ in per_template
+                                for t in find_texts if (pattern_text, t) not in ever_matched]
+    return {"ids": rows, "summary": summary}
 
 
 ## Backup copy of code - works until the find-and-replace part (without the replace)
@@ -1,11 +1,50 @@
 from django.shortcuts import render
 
 # docx_replace/views.py
-import ast, tempfile
+import ast
+import os
+import uuid
+from django.conf import settings
 from django.shortcuts import render
-from django.http import HttpResponse
-from .forms import ReplaceForm
-from .utils import batch_find_replace
+from django.http import StreamingHttpResponse
+from core.zip_utils import stream_zip
+from .forms import GenerateForm, ReplaceForm
+from .models import ReplaceJob
+from .utils import JobReport, iter_find_replace, iter_generate, scan_find_replace
+
+
+def _stream_and_store(chunks, job, fingerprints, report, logs):
+    # Send the ZIP to the browser and keep a copy as the job's artifact.
+    # The job is only saved once the whole archive was produced, so an
+    # interrupted run never becomes the base of an incremental re-run.
+    # The copy is written under a ".part" name and moved into place at the end;
+    # when the client disconnects (GeneratorExit) or the job fails, it is deleted.
+    rel_path = f"docx_replace/jobs/{uuid.uuid4().hex}.zip"
+    abs_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+    part_path = abs_path + ".part"
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    zip_size = 0
+    saved = False
+    try:
+        with open(part_path, "wb") as artifact:
+            for chunk in chunks:
+                artifact.write(chunk)
+                zip_size += len(chunk)
+                yield chunk
+        os.replace(part_path, abs_path)
+        job.output.name = rel_path
+        job.fingerprints = fingerprints
+        job.report = {**report.as_dict(), "output_zip_bytes": zip_size}
+        job.logs = "\n".join(logs)
+        job.save()
+        saved = True
+        ReplaceJob.prune()  # keep the newest DOCX_REPLACE_KEEP_JOBS jobs (and their ZIPs)
+    finally:
+        if not saved:
+            for path in (part_path, abs_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
 
 def replace_view(request):
     if request.method == "POST":
@@ -13,36 +52,125 @@ def replace_view(request):
         if form.is_valid():
             cd = form.cleaned_data
 
-            # Save uploaded Excel to a temp file
-            excel_temp = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
-            for chunk in cd['excel_file'].chunks():
-                excel_temp.write(chunk)
-            excel_temp.flush()
-
-            # Read ZIP bytes
-            zip_bytes = cd['docx_zip'].read()
-
-            # Parse replacements list
-            replacements = ast.literal_eval(cd['replacements'])
-
-            # Run utility
-            output_zip, logs = batch_find_replace(
-                excel_path=excel_temp.name,
-                header_rows=cd['header_rows'],
-                id_col_letter=cd['id_col_letter'],
-                filename_pattern=cd['filename_pattern'],
-                start_id=cd['start_id'],
-                end_id=cd['end_id'],
-                replacements=replacements,
-                docx_zip_bytes=zip_bytes
-            )
+            # Bad rules (syntax, derived-column spec, column letters) and bad input are
+            # raised here, before the first chunk is streamed -> form error instead of a 500
+            try:
+                # Parse replacements list (+ the other templates filled from the same rows)
+                replacements = ast.literal_eval(cd['replacements'])
+                extra_templates = ast.literal_eval(cd['extra_templates']) if cd['extra_templates'] else None
+
+                # Incremental mode: reuse unchanged outputs of an earlier job
+                base_job = cd.get('base_job')
+                previous_fingerprints, previous_zip = None, None
+                if base_job and base_job.output and os.path.isfile(base_job.output.path):
+                    previous_fingerprints, previous_zip = base_job.fingerprints, base_job.output.path
+                fingerprints = {}
+                report, logs = JobReport(), []
+
+                # Run utility - Excel/ZIP are read now, documents are filled
+                # one by one while the response is being sent
+                entries = iter_find_replace(
+                    excel_path=cd['excel_file'],  # pandas reads the upload directly
+                    header_rows=cd['header_rows'],
+                    id_col_letter=cd['id_col_letter'],
+                    filename_pattern=cd['filename_pattern'],
+                    start_id=cd['start_id'],
+                    end_id=cd['end_id'],
+                    replacements=replacements,
+                    docx_zip=cd['docx_zip'],  # opened in place (memory-mapped when Django spooled it to disk)
+                    workers=cd['workers'] if cd['workers'] is not None else 1,
+                    engine=cd['engine'] or "docx",
+                    fingerprints=fingerprints,
+                    previous_fingerprints=previous_fingerprints,
+                    previous_zip=previous_zip,
+                    logs=logs,
+                    report=report,  # timings go into the job and into the ZIP as job_report.json
+                    extra_templates=extra_templates
+                )
+            except (ValueError, SyntaxError) as e:
+                form.add_error(None, str(e))
+                return render(request, "docx_replace/form.html", {"form": form, "show_scan_link": True})
+
+            patterns = [cd['filename_pattern'], *(pattern for pattern, _ in extra_templates or [])]
+            job = ReplaceJob(filename_pattern=" | ".join(patterns)[:255])
 
-            # Return a ZIP file response
-            response = HttpResponse(output_zip, content_type='application/zip')
+            # Return a streaming ZIP file response: each entry goes out as soon
+            # as its document is done, so memory does not grow with the batch
+            response = StreamingHttpResponse(
+                _stream_and_store(stream_zip(entries), job, fingerprints, report, logs), content_type='application/zip'
+            )
             response['Content-Disposition'] = 'attachment; filename="replaced_docs.zip"'
-            # Optionally, you can embed logs in headers or render a template
+            # logs + report are saved with the job (see admin) once the ZIP is complete
             return response
     else:
         form = ReplaceForm()
 
-    return render(request, "docx_replace/form.html", {"form": form})
+    return render(request, "docx_replace/form.html", {"form": form, "show_scan_link": True})
+
+
+def generate_view(request):
+    # Template DOCX + Excel -> one filled DOCX per row, streamed into a ZIP
+    if request.method == "POST":
+        form = GenerateForm(request.POST, request.FILES)
+        if form.is_valid():
+            cd = form.cleaned_data
+            try:
+                entries = iter_generate(
+                    template_bytes=cd['template_file'].read(),  # one template, read once
+                    excel_path=cd['excel_file'],
+                    header_rows=cd['header_rows'],
+                    id_col_letter=cd['id_col_letter'],
+                    output_pattern=cd['output_pattern'],
+                    start_id=cd['start_id'],
+                    end_id=cd['end_id'],
+                    replacements=ast.literal_eval(cd['replacements']),
+                    workers=cd['workers'] if cd['workers'] is not None else 1,
+                    engine=cd['engine'] or "xml",
+                    report=JobReport()  # adds job_report.json to the ZIP
+                )
+            except (ValueError, SyntaxError) as e:  # bad rules / input, raised before streaming starts
+                form.add_error(None, str(e))
+                return render(request, "docx_replace/form.html", {
+                    "form": form,
+                    "title": "EXCEL Rows + Template --> DOCX Batch",
+                    "submit_label": "Generate Documents",
+                })
+            response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+            response['Content-Disposition'] = 'attachment; filename="generated_docs.zip"'
+            return response
+    else:
+        form = GenerateForm()
+
+    return render(request, "docx_replace/form.html", {
+        "form": form,
+        "title": "EXCEL Rows + Template --> DOCX Batch",
+        "submit_label": "Generate Documents",
+    })
+
+
+def scan_view(request):
+    # Dry run with the replace form: report per ID what a real run would do,
+    # without loading python-docx or producing any documents
+    report = None
+    if request.method == "POST":
+        form = ReplaceForm(request.POST, request.FILES)
+        if form.is_valid():
+            cd = form.cleaned_data
+            try:
+                report = scan_find_replace(
+                    excel_path=cd['excel_file'],
+                    header_rows=cd['header_rows'],
+                    id_col_letter=cd['id_col_letter'],
+                    filename_pattern=cd['filename_pattern'],
+                    start_id=cd['start_id'],
+                    end_id=cd['end_id'],
+                    replacements=ast.literal_eval(cd['replacements']),
+                    docx_zip=cd['docx_zip'],
+                    extra_templates=ast.literal_eval(cd['extra_templates']) if cd['extra_templates'] else None
+                )
+            except (ValueError, SyntaxError) as e:
+                form.add_error(None, str(e))
+    else:
+        form = ReplaceForm()
+
+    return render(request, "docx_replace/scan.html", {"form": form, "report": report})
@@ -7,7 +7,8 @@
 
 # docx_utils.py
 import os
-import shutil
+
+from core.zip_utils import precompress
 
 def parse_filename(filename):
     """
@@ -42,15 +43,14 @@ def parse_filename(filename):
         number = int(numeric_part)
         return prefix, number, ext
 
-def clone_docx(source_path, target_start, target_end):
+def clone_names(source_path, target_start, target_end):
     """
-    Clones the source DOCX file into new files with target numbers from target_start to target_end.
-    
+    The naming rule of the cloner, without touching any file: returns the list
+    of new filenames for target numbers target_start..target_end.
+
     - If the source filename ends with a number (e.g., 'TS1.docx'), this trailing number is replaced
       with each new target number.
     - If there is no trailing number, the new number is simply appended.
-
-    Returns a list of the new filenames created.
     """
     # ------------------------------------------------------------------------
     # Expanded extraction of components from the source filename:
@@ -69,7 +69,7 @@ def clone_docx(source_path, target_start, target_end):
     if source_number is None:
         source_number = 0
 
-    created_files = []
+    new_names = []
     for i in range(target_start, target_end + 1):
         if source_number:
             # When the original filename contains a numeric part, we form the new filename by replacing
@@ -83,63 +83,21 @@ def clone_docx(source_path, target_start, target_end):
 #os.path.splitext() method is used to split the pathname into a pair (root, ext), where root is the part of the path before the file extension and ext is the file extension itself. It is particularly useful when you need to extract the file extension or handle files dynamically based on their type. Ex: Path Name /home/User/Desktop/file.txt ; 
 # Root -- /home/User/Desktop/file ; Extension -- .txt
 
+        # Storing the new file name into our list of names.
+        new_names.append(new_filename)
 
+    return new_names
 
-        # The next step copies the source file to the newly constructed filename.
-        #
-        # Explanation of the copy step:
-        # 'shutil.copy2(source_path, new_filename)' copies the file from 'source_path' to 'new_filename'
-        # while preserving the file’s metadata (like creation and modification times). This is similar to
-        # a standard file copy but ensures that more attributes of the file, aside from its content, are maintained.
-        shutil.copy2(source_path, new_filename)
-        
-        # Storing the new file name into our list of created files.
-        created_files.append(new_filename)
-        
-    return created_files
-
-
-
-# # docx_utils.py
-# import os
-# import re
-# import shutil
-
-# def parse_filename(filename):
-#     """
-#     Given a filename (like 'TS1.docx'), split it into:
-#       - prefix (e.g., 'TS')
-#       - a numeric portion (e.g., 1)
-#       - extension (e.g., '.docx')
-#     If no trailing number is found, simply return (base, None, ext)
-#     """
-#     base, ext = os.path.splitext(filename)
-#     match = re.search(r'(\d+)$', base)
-#     if match:
-#         number = int(match.group(1))
-#         prefix = base[:match.start()]
-#         return prefix, number, ext
-#     else:
-#         return base, None, ext
-
-# def clone_docx(source_path, target_start, target_end):
-#     """
-#     Clones the source DOCX file into new files with target numbers from target_start to target_end.
-#     If the source filename ends with a number (e.g., TS1.docx), that numeric part is replaced
-#     with the new number; otherwise, the new number is appended.
-#     Returns a list of the new filenames created.
-#     """
-#     prefix, source_number, ext = parse_filename(source_path)
-#     # Determine default number if none found.
-#     if source_number is None:
-#         source_number = 0
-#     created_files = []
-#     for i in range(target_start, target_end + 1):
-#         if source_number:
-#             new_filename = f"{prefix}{i}{ext}"
-#         else:
-#             base = os.path.splitext(source_path)[0]
-#             new_filename = f"{base}{i}{ext}"
-#         shutil.copy2(source_path, new_filename)
-#         created_files.append(new_filename)
-#     return created_files
+
+def iter_clone_entries(source_bytes, source_name, target_start, target_end):
+    """
+    Clones of the source, named by clone_names(), as (new filename, payload) entries for
+    core.zip_utils.stream_zip() - nothing is written to disk.
+
+    The clones are identical, so the source is compressed (and its CRC computed) only once;
+    every entry is then just a new header in front of that same compressed payload.
+    Entries are produced lazily, so streaming them keeps memory flat however long the range is.
+    """
+    payload = precompress(source_bytes)
+    for new_filename in clone_names(os.path.basename(source_name), target_start, target_end):
+        yield new_filename, payload
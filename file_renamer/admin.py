@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import ArchiveSession
 
 # Register your models here.
+@admin.register(ArchiveSession)
+class ArchiveSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'original_name', 'file_count')
+    search_fields = ('original_name',)
+    readonly_fields = ('index',)
@@ -1,21 +1,24 @@
 # file_renamer/forms.py
 
+import re
+
 from django import forms
 
-class RenameForm(forms.Form):
-    # Form for user input: zip upload and renaming rules.
+from .utils import (COMPOSE_AUTO, COMPOSE_PRODUCT, COMPOSE_SEQUENCE, MATCH_EXACT, MATCH_REGEX, MATCH_STEM,
+                    ORDER_NAME, ORDER_NATURAL)
+
+class PlanForm(forms.Form):
+    # Form for the renaming rules alone (no upload): used on an archive session page,
+    # where the ZIP is already stored, and as the base of RenameForm.
     # What it does: Defines fields for the form, with help texts for UX clarity.
     # How it does it: Uses Django's Form class to create labeled fields with validation.
     
     mode = forms.ChoiceField(
-        choices=[('basic', 'Basic'), ('custom', 'Custom')],
+        choices=[('basic', 'Basic'), ('custom', 'Custom'), ('mapping', 'Mapping (Excel/CSV)')],
         initial='basic',
         label='Renaming Mode',
-        help_text='Basic: Use a single root label with optional numeric prefix/suffix. Custom: Define multiple groups with text and ranges.'
-    )
-    zip_file = forms.FileField(
-        label='Upload Zip File',
-        help_text='Zip containing files to rename (flat structure, no subdirs).'
+        help_text='Basic: Use a single root label with optional numeric prefix/suffix. Custom: Define multiple groups with text and ranges. '
+                  'Mapping: Old name -> new name from a spreadsheet.'
     )
     root_label = forms.CharField(
         max_length=100,
@@ -50,7 +53,53 @@ class RenameForm(forms.Form):
         widget=forms.Textarea(attrs={'rows': 5}),
         required=False,
         label='Custom Rules',
-        help_text='One group per line: text,start,end (e.g., RTG,1,6<br>TS,1,26). Names will be text + number + original ext.'
+        help_text='One group per line: text,start,end (e.g., RTG,1,6<br>TS,1,26). Names will be text + number + original ext. '
+                  'The text can also be a template with {n}, e.g. RTG{n:03d},1,6 gives RTG001..RTG006.'
+    )
+    composition = forms.ChoiceField(
+        choices=[(COMPOSE_AUTO, 'Auto (2 groups combined, otherwise one after another)'),
+                 (COMPOSE_PRODUCT, 'Product (every combination: RTG1 TS1, RTG1 TS2, ...)'),
+                 (COMPOSE_SEQUENCE, 'Sequence (groups one after another: RTG1..RTG6, TS1..TS26)')],
+        initial=COMPOSE_AUTO,
+        required=False,
+        label='Group Composition',
+        help_text='Custom mode: how the groups are combined. The file count must equal the product or the sum of the group sizes.'
+    )
+    mapping_file = forms.FileField(
+        required=False,
+        label='Mapping File',
+        help_text='Mapping mode: Excel (.xlsx) or CSV with the old name in column A and the new name in column B. '
+                  'A new name without extension keeps the file\'s extension, one without "/" stays in the file\'s folder. '
+                  'CSV: comma, semicolon, tab or | separated.'
+    )
+    mapping_header_rows = forms.IntegerField(
+        min_value=0,
+        initial=1,
+        required=False,
+        label='Mapping Header Rows',
+        help_text='Rows to skip at the top of the mapping (default: 1).'
+    )
+    mapping_match = forms.ChoiceField(
+        choices=[(MATCH_EXACT, 'Exact file name'), (MATCH_STEM, 'File name without extension'),
+                 (MATCH_REGEX, 'Regex key')],
+        initial=MATCH_EXACT,
+        required=False,
+        label='Match Files On',
+        help_text='Mapping mode: how archive files are paired with the rows of the mapping.'
+    )
+    mapping_regex = forms.CharField(
+        max_length=200,
+        required=False,
+        label='Key Regex',
+        help_text='Regex key matching: the first group is the key, taken from the file name and from column A '
+                  '(e.g. (\\d+) pairs "IMG_0042.jpg" with "0042").'
+    )
+    order = forms.ChoiceField(
+        choices=[(ORDER_NAME, 'Alphabetical'), (ORDER_NATURAL, 'Natural (file2 before file10)')],
+        initial=ORDER_NAME,
+        required=False,
+        label='File Order',
+        help_text='Order in which the files receive the new names.'
     )
 
     def clean(self):
@@ -68,4 +117,35 @@ class RenameForm(forms.Form):
         elif mode == 'custom':
             if not cleaned_data.get('custom_rule'):
                 self.add_error('custom_rule', 'Required in custom mode.')
-        return cleaned_data
\ No newline at end of file
+        elif mode == 'mapping':
+            if not cleaned_data.get('mapping_file'):
+                self.add_error('mapping_file', 'Required in mapping mode.')
+            if cleaned_data.get('mapping_match') == MATCH_REGEX:
+                regex = cleaned_data.get('mapping_regex')
+                if not regex:
+                    self.add_error('mapping_regex', 'Required for regex key matching.')
+                else:
+                    try:
+                        re.compile(regex)
+                    except re.error as e:
+                        self.add_error('mapping_regex', f'Invalid regex: {e}')
+        return cleaned_data
+
+
+class RenameForm(PlanForm):
+    # Form for user input: zip upload and renaming rules (one-shot rename).
+    zip_file = forms.FileField(
+        label='Upload Zip File',
+        help_text='Zip containing files to rename (flat structure, no subdirs).'
+    )
+
+    field_order = ['mode', 'zip_file']
+
+
+class ArchiveUploadForm(forms.Form):
+    # Upload step of an archive session: the ZIP is stored and indexed once,
+    # rename plans are then tried against it without uploading it again.
+    zip_file = forms.FileField(
+        label='Upload Zip File',
+        help_text='Zip containing files to rename (flat structure, no subdirs). Stored once for this session.'
+    )
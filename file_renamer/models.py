@@ -1,3 +1,43 @@
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 # Create your models here.
+
+# How many of the newest records (and their files under MEDIA_ROOT) are kept;
+# older ones are pruned whenever a new one is saved.
+KEEP_SESSIONS = getattr(settings, 'FILE_RENAMER_KEEP_SESSIONS', 20)
+
+
+class ArchiveSession(models.Model):
+    # A ZIP uploaded once to file_renamer, with the index of its central
+    # directory (utils.index_archive: names, sizes, offsets, natural order).
+    # Rename plans are previewed from the index alone and applied to the
+    # stored archive, so trying another rule never needs a new upload.
+    created_at    = models.DateTimeField(auto_now_add=True)
+    original_name = models.CharField(max_length=255)
+    archive       = models.FileField(upload_to='file_renamer/sessions/')
+    index         = models.JSONField(default=dict)   # {"files": [...], "natural": [...]}
+
+    def __str__(self):
+        return f"#{self.pk} {self.original_name} ({self.created_at:%d.%m.%Y %H:%M})"
+
+    @property
+    def file_count(self):
+        return len(self.index.get("files", []))
+
+    @classmethod
+    def prune(cls, keep=None):
+        # delete all but the `keep` newest records; their files go with them (see below)
+        keep = KEEP_SESSIONS if keep is None else keep
+        stale = cls.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)[keep:]
+        return cls.objects.filter(pk__in=list(stale)).delete()
+
+
+@receiver(post_delete, sender=ArchiveSession)
+def delete_archive_file(sender, instance, **kwargs):
+    # Deleting a record (admin, prune(), queryset.delete()) also removes its file,
+    # otherwise the uploaded archives would pile up in MEDIA_ROOT forever.
+    if instance.archive:
+        instance.archive.delete(save=False)
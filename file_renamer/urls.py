@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import mass_rename
+from .views import mass_rename, session_detail, session_upload
 
 app_name = "file_renamer"
 
 urlpatterns = [
     path('', mass_rename, name='mass_rename'),
-]
\ No newline at end of file
+    path('sessions/', session_upload, name='session_upload'),
+    path('sessions/<int:pk>/', session_detail, name='session'),
+]
@@ -0,0 +1,327 @@
+# file_renamer/utils.py
+# Rename plans for mass_rename and archive sessions.
+#
+# A plan maps every file of the archive (in sort order) to a new name. It is
+# built from the archive *index* alone - names and sizes read from the central
+# directory - so it can be previewed without touching member data; only
+# writing the renamed archive reads the members (copied still compressed).
+
+import os
+import re
+import math
+import zipfile
+import itertools
+from collections import Counter, namedtuple
+
+import pandas as pd
+from openpyxl.utils.exceptions import InvalidFileException
+
+from core.csv_utils import sniff_delimiter
+from core.zip_utils import copy_member
+
+ORDER_NAME = "name"        # plain string order (what mass_rename always did)
+ORDER_NATURAL = "natural"  # digit runs compared as numbers: "f2" before "f10"
+
+COMPOSE_AUTO = "auto"          # two groups -> product, otherwise sequence (the original behaviour)
+COMPOSE_PRODUCT = "product"    # every combination of the groups' numbers
+COMPOSE_SEQUENCE = "sequence"  # the groups one after another
+
+MATCH_EXACT = "exact"  # mapping mode: whole file name
+MATCH_STEM = "stem"    # file name without extension
+MATCH_REGEX = "regex"  # first group of a regex, e.g. (\d+) for "IMG_0042.jpg" -> "0042"
+
+
+class PlanError(ValueError):
+    """
+    A rename plan that cannot be applied. `field` is the form field the
+    message belongs to (None = the whole form).
+    """
+
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.field = field
+
+
+def natural_key(name: str):
+    # re.split with a group alternates text/digits, so the keys always compare
+    # str with str and int with int
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def index_archive(zf: zipfile.ZipFile) -> dict:
+    """
+    Index of the files in `zf`, read from the central directory only
+    (directories and __MACOSX/ entries are skipped):
+      {"files": [{"name", "size", "compress_size", "crc", "offset"}, ...] in name order,
+       "natural": positions in "files" in natural-sort order}
+    JSON-serializable, so it can be stored with the archive.
+    """
+    files = sorted(
+        (
+            {"name": info.filename, "size": info.file_size, "compress_size": info.compress_size,
+             "crc": info.CRC, "offset": info.header_offset}
+            for info in zf.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+        ),
+        key=lambda f: f["name"],
+    )
+    natural = sorted(range(len(files)), key=lambda i: natural_key(files[i]["name"]))
+    return {"files": files, "natural": natural}
+
+
+def ordered_names(index: dict, order: str = ORDER_NAME) -> list:
+    """
+    File names of an index in the order the new names are handed out.
+    """
+    files = index["files"]
+    if order == ORDER_NATURAL:
+        return [files[i]["name"] for i in index["natural"]]
+    return [f["name"] for f in files]
+
+
+def basic_bases(count: int, root: str, use_prefix: bool, use_suffix: bool, start: int = 1, end: int = None):
+    """
+    Basic mode: root label with the running number before and/or after it,
+    numbers start..end (end defaults to start + count - 1).
+    The range is checked against `count` right away; the names themselves are
+    generated lazily.
+    """
+    if end is None:
+        end = start + count - 1
+    if end < start:
+        raise PlanError('End must be >= start.', 'end_num')
+    calc_count = end - start + 1
+    if calc_count != count:
+        raise PlanError(f'Range {start}-{end} covers {calc_count} items, but zip has {count} files.', 'end_num')
+
+    prefix, suffix = bool(use_prefix), bool(use_suffix)
+    return (f"{n if prefix else ''}{root}{n if suffix else ''}" for n in range(start, end + 1))
+
+
+class RuleGroup(namedtuple("RuleGroup", "text start end")):
+    """
+    One line of a custom rule. `text` is either plain text, followed by the
+    number ("RTG" -> "RTG1"), or a template with {n} in it ("RTG{n:02d}" -> "RTG01").
+    """
+    __slots__ = ()
+
+    @property
+    def count(self) -> int:
+        return self.end - self.start + 1
+
+    def name(self, n: int) -> str:
+        return self.text.format(n=n) if "{" in self.text else f"{self.text}{n}"
+
+    def names(self):
+        return (self.name(n) for n in range(self.start, self.end + 1))
+
+
+def parse_custom_rule(custom_rule: str) -> list:
+    """
+    One group per non-empty line: text,start,end -> [RuleGroup, ...].
+    Templates are tried once here, so a bad one is reported with its line.
+    """
+    groups = []
+    for line_num, line in enumerate(custom_rule.splitlines(), start=1):
+        if not line.strip():
+            continue
+        parts = [p.strip() for p in line.rsplit(',', 2)]
+        if len(parts) != 3:
+            raise PlanError(f'Invalid format in line {line_num}: expected text,start,end.', 'custom_rule')
+        try:
+            fr = int(parts[1])
+            to = int(parts[2])
+        except ValueError:
+            raise PlanError(f'Invalid numbers in line {line_num}.', 'custom_rule')
+        if to < fr:
+            raise PlanError(f'Invalid numbers in line {line_num}.', 'custom_rule')
+        group = RuleGroup(parts[0], fr, to)
+        try:
+            group.name(fr)
+        except (KeyError, IndexError, ValueError, AttributeError):
+            raise PlanError(f'Invalid template in line {line_num}: use {{n}}, e.g. {{n:03d}}.', 'custom_rule')
+        groups.append(group)
+    return groups
+
+
+def resolve_composition(groups: list, composition: str = COMPOSE_AUTO) -> str:
+    # "auto" keeps what custom mode always did: two groups are combined, any
+    # other number of groups follow each other
+    if not composition or composition == COMPOSE_AUTO:
+        return COMPOSE_PRODUCT if len(groups) == 2 else COMPOSE_SEQUENCE
+    if composition not in (COMPOSE_PRODUCT, COMPOSE_SEQUENCE):
+        raise PlanError(f'Unknown composition: {composition}', 'composition')
+    return composition
+
+
+def custom_count(groups: list, composition: str) -> int:
+    """
+    Number of names a rule produces, without generating them:
+    product = count1 * count2 * ..., sequence = count1 + count2 + ...
+    """
+    counts = [g.count for g in groups]
+    return math.prod(counts) if composition == COMPOSE_PRODUCT else sum(counts)
+
+
+def iter_custom_bases(groups: list, composition: str):
+    """
+    Names of a custom rule, generated lazily:
+      - product: every combination, the last group varying fastest, parts
+        joined with a space ("RTG1 TS1", "RTG1 TS2", ..., "RTG2 TS1", ...)
+      - sequence: the groups one after another ("RTG1".."RTG6", "TS1".."TS26")
+    """
+    if composition == COMPOSE_PRODUCT:
+        # itertools.product keeps one tuple of names per group, not the combinations
+        for parts in itertools.product(*(tuple(g.names()) for g in groups)):
+            yield " ".join(parts)
+    else:
+        for group in groups:
+            yield from group.names()
+
+
+def custom_bases(count: int, custom_rule: str, composition: str = COMPOSE_AUTO):
+    """
+    Custom mode: any number of groups, combined as a product or a sequence
+    (see iter_custom_bases). The total is computed arithmetically and checked
+    against `count` before a single name is generated.
+    """
+    groups = parse_custom_rule(custom_rule)
+    if not groups:
+        raise PlanError('Required in custom mode.', 'custom_rule')
+    composition = resolve_composition(groups, composition)
+    total_count = custom_count(groups, composition)
+    if total_count != count:
+        raise PlanError(f'Total names from rules ({composition}): {total_count}, but zip has {count} files.',
+                        'custom_rule')
+    return iter_custom_bases(groups, composition)
+
+
+def load_mapping(source, header_rows: int = 1) -> pd.DataFrame:
+    """
+    Read an old name -> new name mapping from an Excel (.xlsx/.xls) or CSV file:
+    old name in the first column, new name in the second, after `header_rows`
+    skipped rows. Only those two columns are read, as text.
+    Returns DataFrame["old", "new"] without empty rows.
+    """
+    name = str(getattr(source, "name", source)).lower()
+    options = {"header": None, "skiprows": header_rows, "usecols": [0, 1], "dtype": str}
+    try:
+        if name.endswith(".csv"):
+            # "," or the ";" of Excel exports in decimal-comma locales (tab, "|")
+            df = pd.read_csv(source, sep=sniff_delimiter(source), **options)
+        else:
+            df = pd.read_excel(source, **options)
+    # fewer than two columns, not a spreadsheet, a corrupt .xlsx (a ZIP inside),
+    # no reader for the format -> a form error, not a 500
+    except (ValueError, IndexError, KeyError, zipfile.BadZipFile, InvalidFileException, OSError, ImportError) as e:
+        raise PlanError(f'Cannot read the mapping (old name in column A, new name in column B): {e}',
+                        'mapping_file')
+    df.columns = ["old", "new"]
+    df = df.fillna("").apply(lambda col: col.str.strip())
+    return df[(df["old"] != "") & (df["new"] != "")].reset_index(drop=True)
+
+
+def _match_keys(names: pd.Series, match: str, regex: str = None) -> pd.Series:
+    # join key of every name (vectorized): the file name without folders, its
+    # stem, or the first group of `regex` (NaN where the regex does not match)
+    names = names.str.rsplit("/", n=1).str[-1]
+    if match == MATCH_STEM:
+        return names.str.replace(r"\.[^./]*$", "", regex=True)
+    if match == MATCH_REGEX:
+        compiled = re.compile(regex)
+        if not compiled.groups:
+            compiled = re.compile(f"({regex})")
+        return names.str.extract(compiled, expand=True).iloc[:, 0]
+    return names
+
+
+def mapping_renames(names: list, mapping: pd.DataFrame, match: str = MATCH_EXACT, regex: str = None):
+    """
+    Join the archive's file names against a mapping (load_mapping) in one
+    hash join, on the exact file name, on the stem (name without extension)
+    or on the key `regex` extracts (its first group) from both sides; a
+    mapping entry the regex does not match is used as the key itself.
+    A new name without an extension gets the file's extension, and one
+    without a folder stays in the file's folder ("scans/a.jpg" + "b" ->
+    "scans/b.jpg"); a new name with "/" is the full path inside the archive.
+    Returns (plan, archive_only, mapping_only):
+      plan: [(old, new)] in the order of `names` - files without a mapping
+            row keep their name
+      archive_only: files without a mapping row
+      mapping_only: mapping entries (old names) without a file
+    Raises PlanError when the mapping lists one key twice.
+    """
+    files = pd.DataFrame({"name": names})
+    files["key"] = _match_keys(files["name"], match, regex)
+    keys = _match_keys(mapping["old"], match, regex)
+    mapping = mapping.assign(key=keys.fillna(mapping["old"]) if match == MATCH_REGEX else keys)
+
+    duplicated = mapping.loc[mapping["key"].duplicated(), "key"].unique()
+    if len(duplicated):
+        more = f' (and {len(duplicated) - 1} more)' if len(duplicated) > 1 else ''
+        raise PlanError(f'The mapping lists the same {match} key twice: {duplicated[0]}{more}', 'mapping_file')
+
+    # files the regex cannot key never match (NaN would join with NaN)
+    keyed = files.dropna(subset=["key"])
+    joined = keyed.merge(mapping, on="key", how="outer", indicator=True, sort=False)
+
+    both = joined[joined["_merge"] == "both"]
+    ext = both["name"].str.extract(r"(\.[^./]*)$", expand=False).fillna("")
+    has_ext = both["new"].str.contains(r"\.[^./]*$", regex=True)
+    new = both["new"].where(has_ext, both["new"] + ext)
+    folder = both["name"].str.extract(r"^(.*/)", expand=False).fillna("")
+    new = new.where(new.str.contains("/", regex=False), folder + new)
+    renamed = dict(zip(both["name"], new))
+
+    plan = [(old, renamed.get(old, old)) for old in names]
+    archive_only = [old for old in names if old not in renamed]
+    mapping_only = joined.loc[joined["_merge"] == "right_only", "old"].tolist()
+    return plan, archive_only, mapping_only
+
+
+def plan_renames(names: list, params: dict, report: dict = None) -> list:
+    """
+    Rename plan for `names` (already in order) from the rule fields of
+    PlanForm (`params` = its cleaned_data): [(old name, new name), ...].
+    Basic/custom: each file keeps its extension; the new names are generated
+    in step with the files. Mapping: see mapping_renames(); the unmatched
+    entries of both sides go into `report` ("archive_only", "mapping_only").
+    Raises PlanError when the rules do not fit the archive or produce the
+    same name twice - checked for the whole plan at once, before anything is
+    written.
+    """
+    if not names:
+        raise PlanError('Zip contains no files.', 'zip_file')
+    if report is None:
+        report = {}
+    if params['mode'] == 'mapping':
+        mapping = load_mapping(params['mapping_file'], params.get('mapping_header_rows') or 0)
+        plan, report['archive_only'], report['mapping_only'] = mapping_renames(
+            names, mapping, params.get('mapping_match') or MATCH_EXACT, params.get('mapping_regex'))
+    else:
+        if params['mode'] == 'basic':
+            bases = basic_bases(len(names), params['root_label'], params['use_prefix'], params['use_suffix'],
+                                params.get('start_num') or 1, params.get('end_num'))
+        else:
+            bases = custom_bases(len(names), params['custom_rule'], params.get('composition'))
+        plan = [(old, base + os.path.splitext(old)[1]) for old, base in zip(names, bases)]
+
+    new_names = [new for _, new in plan]
+    if len(set(new_names)) != len(new_names):
+        duplicates = [new for new, n in Counter(new_names).items() if n > 1]
+        more = f' (and {len(duplicates) - 1} more)' if len(duplicates) > 1 else ''
+        raise PlanError(f'Duplicate file name generated: {duplicates[0]}{more}')
+    return plan
+
+
+def write_renamed(zin: zipfile.ZipFile, plan: list, out):
+    """
+    Write the renamed archive to `out` (path or writable file object).
+    Only the names change, so every member is copied still compressed
+    (bytes + CRC) under its new name: no decompress/recompress, only headers
+    and the central directory are written anew.
+    Raises ValueError for encrypted members.
+    """
+    with zipfile.ZipFile(out, mode='w', compression=zipfile.ZIP_DEFLATED) as zout:
+        for old, new in plan:
+            copy_member(zin, zin.getinfo(old), zout, new)
@@ -4,164 +4,158 @@ from django.shortcuts import render
 # file_renamer/views.py
 
 import os
-import io
 import zipfile
+import tempfile
+
+from django.shortcuts import get_object_or_404, redirect, render
+from django.http import FileResponse
+from core.zip_utils import open_zip
+from .forms import ArchiveUploadForm, PlanForm, RenameForm
+from .models import ArchiveSession
+from .utils import ORDER_NAME, PlanError, index_archive, ordered_names, plan_renames, write_renamed
+
+
+def _write_plan(z, plan):
+    # Create new zip in a temporary file (on disk, deleted once closed) and rewind it.
+    # FileResponse sends it in chunks and closes (deletes) it afterwards.
+    output_io = tempfile.TemporaryFile()
+    try:
+        write_renamed(z, plan, output_io)
+    except Exception:
+        output_io.close()
+        raise
+    output_io.seek(0)
+    return output_io
+
+
+def _describe_unmatched(report, limit=5):
+    # "3 files without a mapping row: a.jpg, b.jpg, c.jpg" (+ the other side), or ""
+    parts = []
+    for key, label in (('archive_only', 'files without a mapping row'),
+                       ('mapping_only', 'mapping rows without a file')):
+        items = report.get(key) or []
+        if items:
+            more = ', ...' if len(items) > limit else ''
+            parts.append(f"{len(items)} {label}: {', '.join(items[:limit])}{more}")
+    return '; '.join(parts)
 
-from django.shortcuts import render
-from django.http import HttpResponse
-from .forms import RenameForm
 
 def mass_rename(request):
     # View for handling form submission and file renaming.
     # What it does: Renders form on GET; processes zip, generates new names, returns new zip on POST.
-    # How it does it: Validates form, extracts zip files, generates bases per mode, creates new zip in memory.
+    # How it does it: Validates form, extracts zip files, generates bases per mode (utils.py), creates new zip in a temporary file.
     
     if request.method == 'POST':
         form = RenameForm(request.POST, request.FILES)
         if form.is_valid():
-            zip_bytes = request.FILES['zip_file'].read()  # zip_file = forms.FileField() in forms.py called by {% for field in form %} in mass_rename.html
-            zip_io = io.BytesIO(zip_bytes)
+            # zip_file = forms.FileField() in forms.py called by {% for field in form %} in mass_rename.html
+            # Large uploads are spooled to disk by Django (TemporaryUploadedFile): the archive is
+            # memory-mapped from there instead of being read into RAM, and members are read lazily.
             try:
-                z = zipfile.ZipFile(zip_io)
+                z = open_zip(request.FILES['zip_file'])
             except zipfile.BadZipFile:
                 form.add_error('zip_file', 'Invalid zip file.')
                 return render(request, 'file_renamer/mass_rename.html', {'form': form})
             
-            file_list = [] # list of file names in zip
-            for f in z.namelist():
-                if not f.endswith('/') and not f.startswith('__MACOSX/'):
-                    file_list.append(f)
-            file_list.sort()
-            num_files = len(file_list)
-            if num_files == 0: # check if zip has no files
-                form.add_error('zip_file', 'Zip contains no files.')
-                z.close()
-                return render(request, 'file_renamer/mass_rename.html', {'form': form})
-            
-            mode = form.cleaned_data['mode']
-            new_bases = []
-            if mode == 'basic': # select basic vs custom mode
-                root = form.cleaned_data['root_label'] # extract parameters from form
-                use_pre = form.cleaned_data['use_prefix']
-                use_suf = form.cleaned_data['use_suffix']
-                start = form.cleaned_data['start_num']
-                end = form.cleaned_data['end_num']
-                if end is None:
-                    end = start + num_files - 1
-                if end < start:
-                    form.add_error('end_num', 'End must be >= start.')
-                    z.close()
-                    return render(request, 'file_renamer/mass_rename.html', {'form': form}) # extracted parameters from form
-                calc_count = end - start + 1
-                if calc_count != num_files:
-                    form.add_error('end_num', f'Range {start}-{end} covers {calc_count} items, but zip has {num_files} files.')
-                    z.close()
-                    return render(request, 'file_renamer/mass_rename.html', {'form': form})
-                # generate new names
-                for i in range(num_files):
-                    num_str = str(start + i)
-                    parts = []
-                    if use_pre: # if prefix checkbox is checked
-                        parts.append(num_str)
-                    parts.append(root)
-                    if use_suf: # if suffix checkbox is checked
-                        parts.append(num_str)
-                    new_base = ''.join(parts)
-                    new_bases.append(new_base)
-            else:  # custom rule
-                custom_rule = form.cleaned_data['custom_rule']
-                groups = []
-                total_count = 0
-                line_num = 1
-                error = False
-                for line in custom_rule.splitlines():
-                    if line.strip():
-                        parts = [p.strip() for p in line.split(',')]
-                        if len(parts) != 3:
-                            form.add_error('custom_rule', f'Invalid format in line {line_num}: expected text,start,end.')
-                            error = True
-                            break
-                        text = parts[0]
-                        try:
-                            fr = int(parts[1])
-                            to = int(parts[2])
-                            if to < fr:
-                                raise ValueError
-                            count = to - fr + 1
-                            total_count += count
-                            groups.append((text, fr, to))
-                        except ValueError:
-                            form.add_error('custom_rule', f'Invalid numbers in line {line_num}.')
-                            error = True
-                            break
-                    line_num += 1
-                if error:
-                    z.close()
-                    return render(request, 'file_renamer/mass_rename.html', {'form': form})
-                if total_count != num_files:
-                    form.add_error('custom_rule', f'Total names from rules: {total_count}, but zip has {num_files} files.')
-                    z.close()
-                    return render(request, 'file_renamer/mass_rename.html', {'form': form})
-                # for text, fr, to in groups:
-                #     for n in range(fr, to + 1):
-                #         new_base = text + str(n)
-                #         new_bases.append(new_base)
-
-                if len(groups) == 2:
-                    text1, fr1, to1 = groups[0]
-                    text2, fr2, to2 = groups[1]
-                    for i in range(fr1, to1 + 1):
-                        for j in range(fr2, to2 + 1):
-                            new_base = f"{text1}{i} {text2}{j}"
-                            new_bases.append(new_base)
-                else:
-                    # fallback to old logic for other cases
-                    for text, fr, to in groups:
-                        for n in range(fr, to + 1):
-                            new_base = text + str(n)
-                            new_bases.append(new_base)
-            
-            # Check for potential duplicate names.
-            new_names_set = set()
-            duplicate = False
-            for i in range(num_files):
-                ext = os.path.splitext(file_list[i])[1]
-                new_name = new_bases[i] + ext
-                if new_name in new_names_set:
-                    form.add_error(None, f'Duplicate file name generated: {new_name}')
-                    duplicate = True
-                    break
-                new_names_set.add(new_name)
-            if duplicate:
+            # Plan the new names from the central directory alone (utils.plan_renames),
+            # then copy every member, still compressed, under its new name.
+            # A mapping that misses files or lists files not in the zip is refused here: there is
+            # no preview in the one-shot rename (the session page shows and allows it).
+            try:
+                names = ordered_names(index_archive(z), form.cleaned_data['order'] or ORDER_NAME)
+                report = {}
+                plan = plan_renames(names, form.cleaned_data, report)
+                unmatched = _describe_unmatched(report)
+                if unmatched:
+                    raise PlanError(unmatched, 'mapping_file')
+                output_io = _write_plan(z, plan)
+            except PlanError as e:
+                form.add_error(e.field, str(e))
+            except ValueError as e:  # encrypted member
+                form.add_error('zip_file', str(e))
+            finally:
                 z.close()
+            if form.errors:
                 return render(request, 'file_renamer/mass_rename.html', {'form': form})
             
-            # Create new zip in memory.
-            output_io = io.BytesIO() # is an in-memory byte buffer.
-            new_z = zipfile.ZipFile(output_io, mode='w', compression=zipfile.ZIP_DEFLATED)
-            for i, orig_path in enumerate(file_list):
-                f_in = z.open(orig_path)
-                data = f_in.read()
-                f_in.close()
-                ext = os.path.splitext(orig_path)[1]
-                new_name = new_bases[i] + ext
-                new_z.writestr(new_name, data)
-            new_z.close()
-            z.close()
-            
             # Prepare HTTP response.
-            output_io.seek(0)
-            zip_content = output_io.read()
-            response = HttpResponse(zip_content, content_type='application/zip') # wrap in HTTP response
-            response['Content-Disposition'] = 'attachment; filename="renamed.zip"'
-            return response # if form is valid return response = HTTPResponse(zip_content, content_type='application/zip')
-# Response flow: Request --> view --> HttpResponse --> Client / Browser
-# browser sets POST request to django url, which dispatches to mass_rename view, which returns the HttPResponse (the response = HttpResponse)
-# Django’s server stack (framework internals) send back the HttpResponse to the client. 
+            response = FileResponse(output_io, content_type='application/zip', as_attachment=True,
+                                    filename='renamed.zip') # wrap in HTTP response
+            return response # if form is valid return response = FileResponse(output_io, content_type='application/zip')
+# Response flow: Request --> view --> FileResponse --> Client / Browser
+# browser sets POST request to django url, which dispatches to mass_rename view, which returns the FileResponse (the response = FileResponse)
+# Django’s server stack (framework internals) send back the FileResponse to the client. 
 # Client receives the HTTP response; BECAUSE THE CONTENT HAS Content--Disposition: and content_type='application/zip', the browser 
 # opens a dialog box to save the zip.
 # Nothing in forms.py or mass_rename.html “receives” the HttpResponse. The django framework delivers the response to the user.
     else:
         form = RenameForm()
     
-    return render(request, 'file_renamer/mass_rename.html', {'form': form})
\ No newline at end of file
+    return render(request, 'file_renamer/mass_rename.html', {'form': form})
+
+
+def session_upload(request):
+    # Archive session, step 1: store the uploaded ZIP once and index its central directory.
+    # What it does: Renders the upload form on GET; on POST saves the archive + index and
+    # redirects to the session page, where rename plans are tried against it.
+    if request.method == 'POST':
+        form = ArchiveUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['zip_file']
+            try:
+                with open_zip(upload) as z:
+                    index = index_archive(z)
+            except zipfile.BadZipFile:
+                form.add_error('zip_file', 'Invalid zip file.')
+            else:
+                if not index['files']:
+                    form.add_error('zip_file', 'Zip contains no files.')
+                else:
+                    session = ArchiveSession(original_name=upload.name, index=index)
+                    session.archive.save(f"{os.path.splitext(upload.name)[0]}.zip", upload, save=True)
+                    ArchiveSession.prune()  # keep the newest FILE_RENAMER_KEEP_SESSIONS uploads
+                    return redirect('file_renamer:session', pk=session.pk)
+    else:
+        form = ArchiveUploadForm()
+
+    sessions = ArchiveSession.objects.order_by('-created_at')[:10]
+    return render(request, 'file_renamer/session_upload.html', {'form': form, 'sessions': sessions})
+
+
+def session_detail(request, pk):
+    # Archive session, step 2: any number of rename plans against the stored archive.
+    # "Preview" lists old -> new names from the stored index only (the ZIP is not opened),
+    # in mapping mode together with the unmatched entries of both sides;
+    # "Rename and Download" applies the plan to the stored archive and returns the new zip.
+    session = get_object_or_404(ArchiveSession, pk=pk)
+    plan = None
+    report = {}
+    if request.method == 'POST':
+        form = PlanForm(request.POST, request.FILES)  # files: mapping mode
+        if form.is_valid():
+            names = ordered_names(session.index, form.cleaned_data['order'] or ORDER_NAME)
+            try:
+                plan = plan_renames(names, form.cleaned_data, report)
+                if 'commit' in request.POST:
+                    with open_zip(session.archive.path) as z:
+                        output_io = _write_plan(z, plan)
+                    stem = os.path.splitext(session.original_name)[0]
+                    return FileResponse(output_io, content_type='application/zip', as_attachment=True,
+                                        filename=f'{stem}_renamed.zip')
+            except PlanError as e:
+                form.add_error(e.field, str(e))
+                plan = None
+            except ValueError as e:  # encrypted member
+                form.add_error(None, str(e))
+                plan = None
+    else:
+        form = PlanForm()
+
+    sizes = {f['name']: f['size'] for f in session.index['files']}
+    return render(request, 'file_renamer/session.html', {
+        'form': form,
+        'session': session,
+        'plan': [(old, new, sizes[old]) for old, new in plan] if plan else None,
+        'archive_only': report.get('archive_only') if plan else None,  # mapping mode: kept under their name
+        'mapping_only': report.get('mapping_only') if plan else None,
+    })